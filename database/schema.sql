@@ -26,6 +26,12 @@ CREATE TABLE user_commodities (
     alerted_at TIMESTAMP DEFAULT NULL
 );
 
+-- alert candidates only; NOW() cannot appear in an index predicate, so
+-- the recent-alert cut-off is applied as a range scan on alerted_at
+CREATE INDEX user_commodities_alert_candidates_idx
+    ON user_commodities (alerted_at)
+    WHERE buy_price IS NOT NULL OR sell_price IS NOT NULL;
+
 CREATE TABLE market_records (
     market_record_id BIGINT PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
     commodity_id BIGINT REFERENCES commodities(commodity_id) ON DELETE CASCADE,
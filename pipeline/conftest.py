@@ -0,0 +1,30 @@
+"""Shared pytest fixtures for the pipeline tests."""
+from unittest.mock import MagicMock
+
+import orjson
+import pytest
+
+from sample_data import SAMPLE_API_RESPONSE
+
+
+@pytest.fixture
+def db_mocks(monkeypatch):
+    """Patches the pooled get_conn in extract and load with one mock
+    connection, returning the (connection, cursor) pair."""
+    cursor = MagicMock()
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    get_conn = MagicMock()
+    get_conn.return_value.__enter__.return_value = conn
+    monkeypatch.setattr("extract.get_conn", get_conn)
+    monkeypatch.setattr("load.get_conn", get_conn)
+    return conn, cursor
+
+
+@pytest.fixture(scope="module")
+def ok_response():
+    """A 200 response carrying SAMPLE_API_RESPONSE, shared per module."""
+    response = MagicMock()
+    response.status_code = 200
+    response.content = orjson.dumps(SAMPLE_API_RESPONSE)
+    return response
@@ -1,11 +1,19 @@
 """A script to hold utility functions for data extraction from FMP API
 to be used in the pipeline."""
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from os import environ as ENV
+from typing import Iterable
 import requests as req
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import pandas as pd
 from dotenv import load_dotenv
-from psycopg2 import connect
+from psycopg2.pool import ThreadedConnectionPool
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,103 +21,187 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-DEFAULT_SYMBOLS = symbols = [
+DEFAULT_SYMBOLS = symbols = frozenset({
     "BZUSD",  # Brent Crude Oil
     "SIUSD",  # Silver
     "GCUSD",  # Gold
+})
+
+# fields of an FMP quote record the pipeline stores, in API order; name,
+# marketCap and exchange are never stored so they are dropped on read
+EXPECTED_COLS = [
+    "symbol", "price", "changePercentage", "change", "volume", "dayLow",
+    "dayHigh", "yearHigh", "yearLow", "priceAvg50", "priceAvg200", "open",
+    "previousClose", "timestamp",
 ]
 
-
-def get_conn():
-    """Establishes and returns a connection to the PostgreSQL database."""
-    logger.debug("Establishing database connection")
-    conn = connect(
+# dtypes of the numeric quote fields; fixed so pandas never has to infer
+# them and an all-null column keeps its type. Nullable Int64 keeps whole
+# numbers whole when FMP sends nulls
+SCHEMA_DTYPES = {
+    "price": "float64",
+    "changePercentage": "float64",
+    "change": "float64",
+    "volume": "Int64",
+    "dayLow": "float64",
+    "dayHigh": "float64",
+    "yearHigh": "float64",
+    "yearLow": "float64",
+    "priceAvg50": "float64",
+    "priceAvg200": "float64",
+    "open": "float64",
+    "previousClose": "float64",
+    "timestamp": "Int64",
+}
+
+# how long, in seconds, a warm process may reuse the tracked symbols
+SYMBOLS_TTL = 300
+
+# upper bound on quote requests kept in flight at once
+FETCH_WORKERS = 32
+
+# symbols quoted per FMP request
+QUOTE_BATCH_SIZE = 50
+
+BATCH_QUOTE_URL = "https://financialmodelingprep.com/stable/batch-quote"
+
+# shared HTTP session: keeps connections alive between symbols and
+# retries transient FMP failures with backoff before giving up
+session = req.Session()
+session.mount("https://", HTTPAdapter(
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+
+
+@lru_cache(maxsize=1)
+def get_pool() -> ThreadedConnectionPool:
+    """Creates the shared PostgreSQL connection pool on first use."""
+    logger.debug("Creating database connection pool")
+    return ThreadedConnectionPool(
+        1, 8,
         dbname=ENV.get("DB_NAME"),
         user=ENV.get("DB_USER"),
         password=ENV.get("DB_PASSWORD"),
         host=ENV.get("DB_HOST"),
         port=ENV.get("DB_PORT"),
     )
-    logger.debug("Database connection established successfully")
-    return conn
-
-
-def fetch_commodity_ids():
-    """Fetch distinct commodity IDs from user_commodities table."""
-    logger.info("Fetching commodity IDs from user_commodities table")
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT commodity_id FROM user_commodities;")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    logger.info("Fetched %d commodity IDs", len(rows))
-    return [row[0] for row in rows]
-
-
-def fetch_symbols_by_ids(ids: list) -> list:
-    """Fetch commodity symbols for given IDs."""
-    logger.info("Fetching symbols for %d commodity IDs", len(ids))
-    symbols = []
-    conn = get_conn()
-    for commodity_id in ids:
+
+
+@contextmanager
+def get_conn():
+    """Yields a pooled connection to the PostgreSQL database."""
+    logger.debug("Taking connection from pool")
+    conn = get_pool().getconn()
+    try:
+        yield conn
+    finally:
+        get_pool().putconn(conn)
+        logger.debug("Connection returned to pool")
+
+
+def fetch_user_symbols() -> list:
+    """Fetch the distinct symbols of all commodities tracked by users."""
+    logger.info("Fetching user tracked symbols")
+    with get_conn() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT symbol FROM commodities WHERE commodity_id = %s;", (commodity_id,))
-        symbol = cursor.fetchone()[0]
-        symbols.append(symbol)
-        logger.debug("Fetched symbol %s for commodity_id %s",
-                     symbol, commodity_id)
+            """SELECT DISTINCT c.symbol FROM commodities c
+            JOIN user_commodities uc ON uc.commodity_id = c.commodity_id;""")
+        rows = cursor.fetchall()
         cursor.close()
-    conn.close()
-    logger.info("Fetched %d symbols", len(symbols))
-    return symbols
+    logger.info("Fetched %d user symbols", len(rows))
+    return [symbol for (symbol,) in rows]
 
 
-def combine_symbols(user_symbols: list) -> set:
-    """Combine user symbols with defaults and return unique set."""
-    return set(user_symbols + DEFAULT_SYMBOLS)
+def combine_symbols(user_symbols: list) -> tuple:
+    """Combine user symbols with defaults and return them unique and sorted."""
+    return tuple(sorted(DEFAULT_SYMBOLS.union(user_symbols)))
 
 
-def get_tracked_symbols() -> list:
-    """Returns the list of commodity symbols tracked by users."""
-    logger.info("Getting tracked symbols")
-    ids = fetch_commodity_ids()
-    user_symbols = fetch_symbols_by_ids(ids)
+@lru_cache(maxsize=1)
+def _cached_tracked_symbols(ttl_bucket: int) -> tuple:
+    """Fetches the tracked symbols once per `ttl_bucket` time window."""
+    logger.info("Getting tracked symbols for window %d", ttl_bucket)
+    user_symbols = fetch_user_symbols()
     combined = combine_symbols(user_symbols)
     logger.info("Total tracked symbols: %d", len(combined))
     return combined
 
 
-def get_commodity_data(symbol: str) -> pd.DataFrame:
-    """Fetches commodity data from FMP API for a given symbol."""
-    logger.info("Fetching data for symbol: %s", symbol)
-    base_url = "https://financialmodelingprep.com/stable/quote"
+def get_tracked_symbols() -> tuple:
+    """Returns the commodity symbols tracked by users, hitting the
+    database at most once every SYMBOLS_TTL seconds."""
+    return _cached_tracked_symbols(int(time.time() // SYMBOLS_TTL))
+
+
+@lru_cache(maxsize=1)
+def _get_api_key() -> str:
+    """Reads the FMP API key from the environment once per process."""
     api_key = ENV.get("API_KEY")
     if not api_key:
         logger.error("API_KEY not found in environment")
         raise ValueError(
             "API_KEY not found in environment. Did you load .env?")
-    url = f"{base_url}?symbol={symbol}&apikey={api_key}"
-    response = req.get(url, timeout=5)
+    return api_key
+
+
+def get_commodity_data_bulk(symbols: Iterable[str]) -> list[dict]:
+    """Fetches quote records for several symbols with one FMP request."""
+    joined = ",".join(symbols)
+    logger.info("Fetching data for symbols: %s", joined)
+    response = session.get(
+        BATCH_QUOTE_URL,
+        params={"symbols": joined, "apikey": _get_api_key()},
+        timeout=5,
+    )
     if response.status_code != 200:
-        logger.error("Error fetching data for %s: %s", symbol, response.text)
-        return pd.DataFrame()
-    data = response.json()
-    logger.debug("Successfully fetched data for %s", symbol)
-    return pd.DataFrame(data)
+        logger.error("Error fetching data for %s: %s", joined, response.text)
+        return []
+    data = orjson.loads(response.content)
+    logger.debug("Successfully fetched data for %s", joined)
+    return data
+
+
+def get_commodity_data(symbol: str) -> list[dict]:
+    """Fetches commodity quote records from FMP API for a given symbol."""
+    return get_commodity_data_bulk([symbol])
+
+
+def iter_commodities():
+    """Yields the quote records of the tracked symbols, one batch of up to
+    QUOTE_BATCH_SIZE symbols at a time, in symbol order.
+
+    Each batch is a single FMP request and batches run concurrently over
+    the shared session, up to FETCH_WORKERS at once.
+    """
+    symbols = get_tracked_symbols()
+    logger.info("Fetching data for %d commodities", len(symbols))
+    batches = [symbols[i:i + QUOTE_BATCH_SIZE]
+               for i in range(0, len(symbols), QUOTE_BATCH_SIZE)]
+    workers = max(1, min(FETCH_WORKERS, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(get_commodity_data_bulk, batches)
+
+
+def records_to_frame(records: list[dict]) -> pd.DataFrame:
+    """Builds a DataFrame of quote records with the fixed column schema."""
+    return pd.DataFrame.from_records(
+        records, columns=EXPECTED_COLS).astype(SCHEMA_DTYPES)
 
 
 def loop_commodities() -> pd.DataFrame:
     """Loops through a list of commodity symbols and fetches their data."""
     logger.info("Starting to loop through commodities")
-    all_data = pd.DataFrame()
-    symbols = get_tracked_symbols()
-    for symbol in symbols:
-        df = get_commodity_data(symbol)
-        all_data = pd.concat([all_data, df], ignore_index=True)
-    logger.info("Completed fetching data for %d commodities, total records: %d", len(
-        symbols), len(all_data))
+    records = [record for batch in iter_commodities() for record in batch]
+    all_data = records_to_frame(records)
+    logger.info("Completed fetching commodities, total records: %d",
+                len(all_data))
     return all_data
 
 
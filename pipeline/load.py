@@ -1,9 +1,13 @@
 """Script to load the transformed data into the database."""
 import logging
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain
 from os import environ as ENV
+from typing import Iterable
 import pandas as pd
-from psycopg2 import connect
-from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 logging.basicConfig(
@@ -12,56 +16,141 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ingested_at is left to the column's DEFAULT CURRENT_TIMESTAMP
+INSERT_COLS = (
+    "commodity_id", "recorded_at", "price", "volume", "day_high", "day_low",
+    "change", "change_percentage", "open_price", "previous_close",
+    "price_avg_50", "price_avg_200", "year_high", "year_low",
+)
 
-def get_conn():
-    """Establishes and returns a connection to the PostgreSQL database."""
-    logger.debug("Establishing database connection")
-    conn = connect(
+INSERT_SQL = f"INSERT INTO market_records ({', '.join(INSERT_COLS)}) VALUES %s"
+
+COPY_SQL = (
+    f"COPY market_records ({', '.join(INSERT_COLS)}) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+
+@lru_cache(maxsize=1)
+def get_pool() -> ThreadedConnectionPool:
+    """Creates the shared PostgreSQL connection pool on first use."""
+    logger.debug("Creating database connection pool")
+    return ThreadedConnectionPool(
+        1, 8,
         dbname=ENV.get("DB_NAME"),
         user=ENV.get("DB_USER"),
         password=ENV.get("DB_PASSWORD"),
         host=ENV.get("DB_HOST"),
         port=ENV.get("DB_PORT"),
     )
-    logger.debug("Database connection established successfully")
-    return conn
+
+
+@contextmanager
+def get_conn():
+    """Yields a pooled connection to the PostgreSQL database."""
+    logger.debug("Taking connection from pool")
+    conn = get_pool().getconn()
+    try:
+        yield conn
+    finally:
+        get_pool().putconn(conn)
+        logger.debug("Connection returned to pool")
 
 
 def load_data(file_path: str) -> pd.DataFrame:
-    """Loads data from a CSV file into a DataFrame."""
+    """Loads data from a Parquet or CSV file into a DataFrame."""
     logger.info("Loading data from %s", file_path)
-    df = pd.read_csv(file_path)
+    if file_path.endswith(".parquet"):
+        df = pd.read_parquet(file_path, engine="pyarrow")
+    else:
+        df = pd.read_csv(file_path, engine="pyarrow")
     logger.info("Loaded %d records from %s", len(df), file_path)
     return df
 
 
 def insert_into_db(df: pd.DataFrame):
     """Inserts the DataFrame data into the specified database table."""
+    if df is None or df.empty:
+        logger.info("No records to insert into market_records")
+        return
     logger.info("Starting database insert for %d records", len(df))
-    conn = get_conn()
-    cursor = conn.cursor()
-
-    query = """
-        INSERT INTO market_records (
-            commodity_id, recorded_at, price, volume, day_high, day_low,
-            change, change_percentage, open_price, previous_close,
-            price_avg_50, price_avg_200, year_high, year_low, ingested_at
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-    """
+    frame = df[list(INSERT_COLS)]
+    # datetime64[us] is the finest unit NumPy's tolist() turns into
+    # datetime objects; nanosecond columns would come back as bare ints
+    datetime_cols = frame.select_dtypes("datetime").columns
+    rows = frame.to_records(
+        index=False,
+        column_dtypes=dict.fromkeys(datetime_cols, "datetime64[us]"),
+    ).tolist()
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        logger.debug("Executing multi-row insert")
+        execute_values(cursor, INSERT_SQL, rows, page_size=1000)
+        conn.commit()
+        cursor.close()
+    logger.info("Successfully inserted %d records into market_records", len(df))
 
-    rows = [tuple(row) for row in df.itertuples(index=False)]
-    logger.debug("Executing batch insert")
-    execute_batch(cursor, query, rows)
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-    logger.info("Successfully inserted %d records into market_records", len(df))
+class FrameCsvReader:
+    """File-like reader that renders DataFrames to CSV only as COPY asks
+    for more input, so at most one frame's CSV is held in memory."""
+
+    def __init__(self, frames: Iterable[pd.DataFrame]):
+        self.rows = 0
+        self._frames = iter(frames)
+        self._buffer = ""
+
+    def _next_chunk(self) -> str:
+        """Renders the next frame as headerless CSV, or '' when exhausted."""
+        for frame in self._frames:
+            if not frame.empty:
+                self.rows += len(frame)
+                return frame[list(INSERT_COLS)].to_csv(header=False, index=False)
+        return ""
+
+    def read(self, size: int = -1) -> str:
+        """Returns up to `size` characters of CSV, all of it when negative."""
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def stream_into_db(frames: Iterable[pd.DataFrame]) -> int:
+    """Streams DataFrames into market_records through a single COPY.
+
+    Frames are consumed lazily, so a generator that extracts and transforms
+    one batch at a time never needs the whole dataset in memory.
+
+    Returns:
+        int: Number of records loaded
+    """
+    frames = iter(frames)
+    first = next((frame for frame in frames if not frame.empty), None)
+    if first is None:
+        logger.info("No records to stream into market_records")
+        return 0
+
+    reader = FrameCsvReader(chain([first], frames))
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        logger.debug("Streaming records through COPY")
+        cursor.copy_expert(COPY_SQL, reader)
+        conn.commit()
+        cursor.close()
+    logger.info("Successfully streamed %d records into market_records",
+                reader.rows)
+    return reader.rows
 
 
 if __name__ == "__main__":
     load_dotenv()
     logger.info("Starting load script")
-    df = load_data("clean_commodity_data.csv")
+    df = load_data("clean_commodity_data.parquet")
     insert_into_db(df)
     logger.info("Load script completed successfully")
@@ -2,9 +2,9 @@
 import logging
 from dotenv import load_dotenv
 
-from extract import loop_commodities
+from extract import iter_commodities, records_to_frame
 from transform import apply_transformations
-from load import insert_into_db
+from load import stream_into_db
 import pandas as pd
 
 logging.basicConfig(
@@ -15,30 +15,38 @@ logger = logging.getLogger(__name__)
 
 
 def run_pipeline() -> pd.DataFrame:
-    """Run the full ETL pipeline: extract → transform → load."""
-    logger.info("Starting ETL pipeline...")
+    """Run the full ETL pipeline: extract → transform → load.
 
-    # Extract: fetch commodity data from FMP API
-    logger.info("Extracting data from API...")
-    raw_df = loop_commodities()
-    logger.info("Extracted %d records", len(raw_df))
+    Each batch of quote records is transformed and streamed into the
+    database as it arrives, so only one batch is held in memory at a time.
 
-    if raw_df.empty:
-        logger.warning("No data extracted. Exiting pipeline.")
-        return
+    Returns:
+        pd.DataFrame: commodity_id and price of every loaded record
+    """
+    logger.info("Starting ETL pipeline...")
+    prices = []
 
-    # Transform: clean and reshape data
-    logger.info("Transforming data...")
-    clean_df = apply_transformations(raw_df)
-    logger.info("Transformed %d records", len(clean_df))
+    def transformed_batches():
+        # Extract: fetch commodity data from FMP API, one batch at a time
+        for records in iter_commodities():
+            if not records:
+                continue
+            # Transform: clean and reshape data
+            clean_df = apply_transformations(records_to_frame(records))
+            prices.append(clean_df[["commodity_id", "price"]])
+            yield clean_df
 
-    # Load: insert into database
-    logger.info("Loading data into database...")
-    insert_into_db(clean_df)
-    logger.info("Loaded %d records", len(clean_df))
+    # Load: stream every transformed batch through one COPY
+    logger.info("Streaming data into database...")
+    loaded = stream_into_db(transformed_batches())
+
+    if not loaded:
+        logger.warning("No data extracted. Exiting pipeline.")
+        return pd.DataFrame(columns=["commodity_id", "price"])
 
+    logger.info("Loaded %d records", loaded)
     logger.info("ETL pipeline complete.")
-    return clean_df
+    return pd.concat(prices, ignore_index=True)
 
 
 def handler(event, context):
@@ -0,0 +1,24 @@
+"""Sample FMP API data shared by the pipeline tests."""
+
+# Sample API response matching FMP structure
+SAMPLE_API_RESPONSE = [
+    {
+        "symbol": "GCUSD",
+        "name": "Gold Futures",
+        "price": 3375.3,
+        "changePercentage": -0.65635,
+        "change": -22.3,
+        "volume": 170936,
+        "dayLow": 3355.2,
+        "dayHigh": 3401.1,
+        "yearHigh": 3509.9,
+        "yearLow": 2354.6,
+        "marketCap": None,
+        "priceAvg50": 3358.706,
+        "priceAvg200": 3054.501,
+        "exchange": "COMMODITY",
+        "open": 3398.6,
+        "previousClose": 3397.6,
+        "timestamp": 1753372205
+    }
+]
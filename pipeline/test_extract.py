@@ -1,153 +1,100 @@
 """Script to test the extract module functions."""
 from unittest.mock import patch, MagicMock
+import orjson
 import pytest
 import pandas as pd
+import extract
 from extract import (
     get_commodity_data,
-    fetch_commodity_ids,
-    fetch_symbols_by_ids,
+    fetch_user_symbols,
     combine_symbols,
     get_tracked_symbols,
+    get_conn,
+    loop_commodities,
+    iter_commodities,
+    get_commodity_data_bulk,
+    QUOTE_BATCH_SIZE,
+    EXPECTED_COLS,
+    session,
+    _cached_tracked_symbols,
+    SYMBOLS_TTL,
+    FETCH_WORKERS,
+    _get_api_key,
+    records_to_frame,
+    SCHEMA_DTYPES,
 )
+from sample_data import SAMPLE_API_RESPONSE
 
 
-# Sample API response matching FMP structure
-SAMPLE_API_RESPONSE = [
-    {
-        "symbol": "GCUSD",
-        "name": "Gold Futures",
-        "price": 3375.3,
-        "changePercentage": -0.65635,
-        "change": -22.3,
-        "volume": 170936,
-        "dayLow": 3355.2,
-        "dayHigh": 3401.1,
-        "yearHigh": 3509.9,
-        "yearLow": 2354.6,
-        "marketCap": None,
-        "priceAvg50": 3358.706,
-        "priceAvg200": 3054.501,
-        "exchange": "COMMODITY",
-        "open": 3398.6,
-        "previousClose": 3397.6,
-        "timestamp": 1753372205
-    }
-]
+@pytest.fixture(autouse=True)
+def empty_caches():
+    """Start every test without a cached API key."""
+    _get_api_key.cache_clear()
+    yield
+    _get_api_key.cache_clear()
 
 
 class TestGetCommodityDataSuccess:
     """Tests for successful API responses."""
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_returns_dataframe_on_success(self, mock_get):
-        """Should return a DataFrame when API returns 200."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = SAMPLE_API_RESPONSE
-        mock_get.return_value = mock_response
+    @patch("extract.session.get")
+    def test_returns_records_on_success(self, mock_get, ok_response):
+        """Should return the quote records when API returns 200."""
+        mock_get.return_value = ok_response
 
         result = get_commodity_data("GCUSD")
 
-        assert isinstance(result, pd.DataFrame)
+        assert isinstance(result, list)
         assert len(result) == 1
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_dataframe_contains_expected_columns(self, mock_get):
-        """Should contain all expected columns from API response."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = SAMPLE_API_RESPONSE
-        mock_get.return_value = mock_response
-
-        result = get_commodity_data("GCUSD")
-
-        expected_cols = [
-            "symbol", "name", "price", "changePercentage", "change",
-            "volume", "dayLow", "dayHigh", "yearHigh", "yearLow",
-            "priceAvg50", "priceAvg200", "open", "previousClose", "timestamp"
-        ]
-        for col in expected_cols:
-            assert col in result.columns, f"Missing column: {col}"
-
-    @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_dataframe_values_match_response(self, mock_get):
+    @patch("extract.session.get")
+    def test_record_values_match_response(self, mock_get, ok_response):
         """Should correctly parse values from API response."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = SAMPLE_API_RESPONSE
-        mock_get.return_value = mock_response
+        mock_get.return_value = ok_response
 
         result = get_commodity_data("GCUSD")
 
-        assert result.iloc[0]["symbol"] == "GCUSD"
-        assert result.iloc[0]["price"] == 3375.3
-        assert result.iloc[0]["volume"] == 170936
-        assert result.iloc[0]["changePercentage"] == -0.65635
+        assert result[0]["symbol"] == "GCUSD"
+        assert result[0]["price"] == 3375.3
+        assert result[0]["volume"] == 170936
+        assert result[0]["changePercentage"] == -0.65635
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_constructs_correct_url(self, mock_get):
+    @patch("extract.session.get")
+    def test_constructs_correct_url(self, mock_get, ok_response):
         """Should construct URL with symbol and API key."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = SAMPLE_API_RESPONSE
-        mock_get.return_value = mock_response
+        mock_get.return_value = ok_response
 
         get_commodity_data("GCUSD")
 
-        called_url = mock_get.call_args[0][0]
-        assert "symbol=GCUSD" in called_url
-        assert "apikey=test_key_123" in called_url
-        assert "financialmodelingprep.com" in called_url
+        params = mock_get.call_args.kwargs["params"]
+        assert params["symbols"] == "GCUSD"
+        assert params["apikey"] == "test_key_123"
+        assert "financialmodelingprep.com" in mock_get.call_args[0][0]
 
 
 class TestGetCommodityDataFailures:
     """Tests for error handling."""
 
+    @pytest.mark.parametrize("code,text", [
+        (401, "Invalid API Key"),
+        (404, "Not Found"),
+        (500, "Internal Server Error"),
+    ])
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_returns_empty_dataframe_on_404(self, mock_get):
-        """Should return empty DataFrame when API returns 404."""
+    @patch("extract.session.get")
+    def test_returns_no_records_on_error(self, mock_get, code, text):
+        """Should return no records when the API responds with an error."""
         mock_response = MagicMock()
-        mock_response.status_code = 404
-        mock_response.text = "Not Found"
-        mock_get.return_value = mock_response
-
-        result = get_commodity_data("INVALID")
-
-        assert isinstance(result, pd.DataFrame)
-        assert len(result) == 0
-
-    @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_returns_empty_dataframe_on_500(self, mock_get):
-        """Should return empty DataFrame when API returns 500."""
-        mock_response = MagicMock()
-        mock_response.status_code = 500
-        mock_response.text = "Internal Server Error"
+        mock_response.status_code = code
+        mock_response.text = text
         mock_get.return_value = mock_response
 
         result = get_commodity_data("GCUSD")
 
-        assert isinstance(result, pd.DataFrame)
-        assert len(result) == 0
-
-    @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_returns_empty_dataframe_on_401(self, mock_get):
-        """Should return empty DataFrame on authentication error."""
-        mock_response = MagicMock()
-        mock_response.status_code = 401
-        mock_response.text = "Invalid API Key"
-        mock_get.return_value = mock_response
-
-        result = get_commodity_data("GCUSD")
-
-        assert isinstance(result, pd.DataFrame)
-        assert len(result) == 0
+        assert result == []
 
     @patch.dict("os.environ", {}, clear=True)
     def test_raises_error_when_api_key_missing(self):
@@ -157,8 +104,19 @@ class TestGetCommodityDataFailures:
 
         assert "API_KEY not found" in str(exc_info.value)
 
+    @patch("extract.session.get")
+    def test_reads_api_key_once(self, mock_get, ok_response):
+        """Should keep using the API key read on the first request."""
+        mock_get.return_value = ok_response
+        with patch.dict("os.environ", {"API_KEY": "test_key_123"}):
+            get_commodity_data("GCUSD")
+        with patch.dict("os.environ", {}, clear=True):
+            get_commodity_data("GCUSD")
+
+        assert mock_get.call_args.kwargs["params"]["apikey"] == "test_key_123"
+
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
+    @patch("extract.session.get")
     def test_handles_timeout(self, mock_get):
         """Should handle request timeout gracefully."""
         import requests
@@ -169,25 +127,50 @@ class TestGetCommodityDataFailures:
             get_commodity_data("GCUSD")
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_returns_empty_dataframe_on_empty_response(self, mock_get):
+    @patch("extract.session.get")
+    def test_returns_no_records_on_empty_response(self, mock_get):
         """Should handle empty list response from API."""
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = []
+        mock_response.content = orjson.dumps([])
         mock_get.return_value = mock_response
 
         result = get_commodity_data("GCUSD")
 
-        assert isinstance(result, pd.DataFrame)
-        assert len(result) == 0
+        assert result == []
+
+
+class TestSession:
+    """Tests for the shared HTTP session."""
+
+    def test_retries_transient_errors(self):
+        """Should retry rate limits and server errors with backoff."""
+        retry = session.get_adapter(
+            "https://financialmodelingprep.com").max_retries
+
+        assert retry.total == 3
+        assert retry.backoff_factor == 0.3
+        assert {429, 500, 502, 503, 504} <= set(retry.status_forcelist)
+
+    def test_returns_final_response_after_retries(self):
+        """Should hand back the last error response rather than raising."""
+        retry = session.get_adapter(
+            "https://financialmodelingprep.com").max_retries
+
+        assert retry.raise_on_status is False
+
+    def test_keeps_a_connection_per_fetch_worker(self):
+        """Should keep enough pooled connections for every fetch thread."""
+        adapter = session.get_adapter("https://financialmodelingprep.com")
+
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] >= FETCH_WORKERS
 
 
 class TestGetCommodityDataEdgeCases:
     """Tests for edge cases and data quality."""
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
+    @patch("extract.session.get")
     def test_handles_null_values_in_response(self, mock_get):
         """Should handle null values in API response."""
         response_with_nulls = [{
@@ -211,37 +194,31 @@ class TestGetCommodityDataEdgeCases:
         }]
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = response_with_nulls
+        mock_response.content = orjson.dumps(response_with_nulls)
         mock_get.return_value = mock_response
 
         result = get_commodity_data("GCUSD")
 
         assert len(result) == 1
-        assert pd.isna(result.iloc[0]["volume"])
-        assert pd.isna(result.iloc[0]["changePercentage"])
+        assert result[0]["volume"] is None
+        assert result[0]["changePercentage"] is None
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_handles_special_characters_in_symbol(self, mock_get):
-        """Should properly encode symbols in URL."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = SAMPLE_API_RESPONSE
-        mock_get.return_value = mock_response
+    @patch("extract.session.get")
+    def test_handles_special_characters_in_symbol(self, mock_get, ok_response):
+        """Should leave symbol encoding to requests rather than the URL."""
+        mock_get.return_value = ok_response
 
         get_commodity_data("ZC=F")
 
-        called_url = mock_get.call_args[0][0]
-        assert "symbol=ZC=F" in called_url or "symbol=ZC%3DF" in called_url
+        assert mock_get.call_args.kwargs["params"]["symbols"] == "ZC=F"
+        assert "ZC=F" not in mock_get.call_args[0][0]
 
     @patch.dict("os.environ", {"API_KEY": "test_key_123"})
-    @patch("extract.req.get")
-    def test_timeout_parameter_is_set(self, mock_get):
+    @patch("extract.session.get")
+    def test_timeout_parameter_is_set(self, mock_get, ok_response):
         """Should set timeout parameter on request."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = SAMPLE_API_RESPONSE
-        mock_get.return_value = mock_response
+        mock_get.return_value = ok_response
 
         get_commodity_data("GCUSD")
 
@@ -250,194 +227,325 @@ class TestGetCommodityDataEdgeCases:
         assert kwargs["timeout"] == 5
 
 
-class TestFetchCommodityIds:
-    """Tests for fetch_commodity_ids function."""
-
-    @patch("extract.get_conn")
-    def test_returns_list_of_ids(self, mock_get_conn):
-        """Should return list of commodity IDs from database."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [(1,), (2,), (3,)]
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
-
-        result = fetch_commodity_ids()
-
-        assert result == [1, 2, 3]
-
-    @patch("extract.get_conn")
-    def test_returns_empty_list_when_no_data(self, mock_get_conn):
-        """Should return empty list when no user commodities exist."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = []
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
-
-        result = fetch_commodity_ids()
-
-        assert result == []
+class TestGetConn:
+    """Tests for get_conn function."""
 
-    @patch("extract.get_conn")
-    def test_executes_correct_query(self, mock_get_conn):
-        """Should execute SELECT DISTINCT query."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = []
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    @patch("extract.get_pool")
+    def test_returns_connection_to_pool(self, mock_get_pool):
+        """Should borrow a pooled connection and put it back afterwards."""
+        mock_pool = mock_get_pool.return_value
 
-        fetch_commodity_ids()
+        with get_conn() as conn:
+            assert conn is mock_pool.getconn.return_value
+            mock_pool.putconn.assert_not_called()
 
-        mock_cursor.execute.assert_called_once_with(
-            "SELECT DISTINCT commodity_id FROM user_commodities;"
-        )
+        mock_pool.putconn.assert_called_once_with(conn)
 
-    @patch("extract.get_conn")
-    def test_closes_cursor_and_connection(self, mock_get_conn):
-        """Should properly close cursor and connection."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [(1,)]
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    @patch("extract.get_pool")
+    def test_returns_connection_to_pool_on_error(self, mock_get_pool):
+        """Should put the connection back even if the caller raises."""
+        mock_pool = mock_get_pool.return_value
 
-        fetch_commodity_ids()
+        with pytest.raises(RuntimeError):
+            with get_conn():
+                raise RuntimeError("boom")
 
-        mock_cursor.close.assert_called_once()
-        mock_conn.close.assert_called_once()
+        mock_pool.putconn.assert_called_once_with(
+            mock_pool.getconn.return_value)
 
 
-class TestFetchSymbolsByIds:
-    """Tests for fetch_symbols_by_ids function."""
+class TestFetchUserSymbols:
+    """Tests for fetch_user_symbols function."""
 
-    @patch("extract.get_conn")
-    def test_returns_symbols_for_ids(self, mock_get_conn):
-        """Should return list of symbols for given IDs."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchone.side_effect = [("GCUSD",), ("CLUSD",), ("SIUSD",)]
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    def test_returns_list_of_symbols(self, db_mocks):
+        """Should return list of tracked symbols from database."""
+        _, mock_cursor = db_mocks
+        mock_cursor.fetchall.return_value = [("GCUSD",), ("CLUSD",), ("SIUSD",)]
 
-        result = fetch_symbols_by_ids([1, 2, 3])
+        result = fetch_user_symbols()
 
         assert result == ["GCUSD", "CLUSD", "SIUSD"]
 
-    @patch("extract.get_conn")
-    def test_returns_empty_list_for_empty_input(self, mock_get_conn):
-        """Should return empty list when given no IDs."""
-        mock_conn = MagicMock()
-        mock_get_conn.return_value = mock_conn
+    def test_returns_empty_list_when_no_data(self, db_mocks):
+        """Should return empty list when no user commodities exist."""
+        _, mock_cursor = db_mocks
+        mock_cursor.fetchall.return_value = []
 
-        result = fetch_symbols_by_ids([])
+        result = fetch_user_symbols()
 
         assert result == []
 
-    @patch("extract.get_conn")
-    def test_executes_query_for_each_id(self, mock_get_conn):
-        """Should execute one query per ID."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchone.side_effect = [("GCUSD",), ("CLUSD",)]
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    def test_executes_single_join_query(self, db_mocks):
+        """Should fetch symbols with one JOIN query."""
+        _, mock_cursor = db_mocks
+        mock_cursor.fetchall.return_value = []
 
-        fetch_symbols_by_ids([1, 2])
+        fetch_user_symbols()
 
-        assert mock_cursor.execute.call_count == 2
-        mock_cursor.execute.assert_any_call(
-            "SELECT symbol FROM commodities WHERE commodity_id = %s;", (1,)
-        )
-        mock_cursor.execute.assert_any_call(
-            "SELECT symbol FROM commodities WHERE commodity_id = %s;", (2,)
-        )
+        mock_cursor.execute.assert_called_once()
+        query = mock_cursor.execute.call_args[0][0]
+        assert "SELECT DISTINCT c.symbol" in query
+        assert "JOIN user_commodities" in query
 
-    @patch("extract.get_conn")
-    def test_closes_connection_after_all_queries(self, mock_get_conn):
-        """Should close connection after processing all IDs."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = ("GCUSD",)
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    def test_closes_cursor_and_releases_connection(self, db_mocks):
+        """Should close the cursor and hand the connection back to the pool."""
+        mock_conn, mock_cursor = db_mocks
+        mock_cursor.fetchall.return_value = [("GCUSD",)]
 
-        fetch_symbols_by_ids([1, 2, 3])
+        fetch_user_symbols()
 
-        mock_conn.close.assert_called_once()
+        mock_cursor.close.assert_called_once()
+        mock_conn.close.assert_not_called()
+        extract.get_conn.return_value.__exit__.assert_called_once()
 
 
 class TestCombineSymbols:
     """Tests for combine_symbols function."""
 
-    @patch("extract.DEFAULT_SYMBOLS", ["GCUSD", "CLUSD"])
+    @patch("extract.DEFAULT_SYMBOLS", frozenset({"GCUSD", "CLUSD"}))
     def test_combines_user_and_default_symbols(self):
         """Should combine user symbols with defaults."""
         result = combine_symbols(["SIUSD", "NGUSD"])
 
-        assert result == {"GCUSD", "CLUSD", "SIUSD", "NGUSD"}
+        assert result == ("CLUSD", "GCUSD", "NGUSD", "SIUSD")
 
-    @patch("extract.DEFAULT_SYMBOLS", ["GCUSD", "CLUSD"])
+    @patch("extract.DEFAULT_SYMBOLS", frozenset({"GCUSD", "CLUSD"}))
     def test_removes_duplicates(self):
         """Should return unique symbols only."""
         result = combine_symbols(
             ["GCUSD", "SIUSD"])  # GCUSD is also in defaults
 
-        assert result == {"GCUSD", "CLUSD", "SIUSD"}
+        assert result == ("CLUSD", "GCUSD", "SIUSD")
         assert len(result) == 3
 
-    @patch("extract.DEFAULT_SYMBOLS", ["GCUSD", "CLUSD"])
+    @patch("extract.DEFAULT_SYMBOLS", frozenset({"GCUSD", "CLUSD"}))
     def test_returns_defaults_when_user_list_empty(self):
         """Should return defaults when no user symbols."""
         result = combine_symbols([])
 
-        assert result == {"GCUSD", "CLUSD"}
+        assert result == ("CLUSD", "GCUSD")
 
-    @patch("extract.DEFAULT_SYMBOLS", [])
+    @patch("extract.DEFAULT_SYMBOLS", frozenset())
     def test_returns_user_symbols_when_no_defaults(self):
         """Should return user symbols when defaults empty."""
         result = combine_symbols(["SIUSD", "NGUSD"])
 
-        assert result == {"SIUSD", "NGUSD"}
+        assert result == ("NGUSD", "SIUSD")
 
-    @patch("extract.DEFAULT_SYMBOLS", [])
-    def test_returns_empty_set_when_both_empty(self):
-        """Should return empty set when both lists empty."""
+    @patch("extract.DEFAULT_SYMBOLS", frozenset())
+    def test_returns_empty_tuple_when_both_empty(self):
+        """Should return empty tuple when both lists empty."""
         result = combine_symbols([])
 
-        assert result == set()
+        assert result == ()
+
+    @patch("extract.DEFAULT_SYMBOLS", frozenset({"GCUSD", "CLUSD"}))
+    def test_order_is_deterministic(self):
+        """Should return the same sorted order regardless of input order."""
+        assert combine_symbols(["SIUSD", "BZUSD"]) == combine_symbols(
+            ["BZUSD", "SIUSD"])
 
 
 class TestGetTrackedSymbols:
     """Tests for get_tracked_symbols function."""
 
+    def setup_method(self):
+        """Start every test with an empty symbols cache."""
+        _cached_tracked_symbols.cache_clear()
+
     @patch("extract.combine_symbols")
-    @patch("extract.fetch_symbols_by_ids")
-    @patch("extract.fetch_commodity_ids")
-    def test_orchestrates_all_functions(self, mock_fetch_ids, mock_fetch_symbols, mock_combine):
+    @patch("extract.fetch_user_symbols")
+    def test_orchestrates_all_functions(self, mock_fetch_symbols, mock_combine):
         """Should call all helper functions in correct order."""
-        mock_fetch_ids.return_value = [1, 2]
         mock_fetch_symbols.return_value = ["GCUSD", "CLUSD"]
         mock_combine.return_value = {"GCUSD", "CLUSD", "SIUSD"}
 
         result = get_tracked_symbols()
 
-        mock_fetch_ids.assert_called_once()
-        mock_fetch_symbols.assert_called_once_with([1, 2])
+        mock_fetch_symbols.assert_called_once_with()
         mock_combine.assert_called_once_with(["GCUSD", "CLUSD"])
         assert result == {"GCUSD", "CLUSD", "SIUSD"}
 
     @patch("extract.combine_symbols")
-    @patch("extract.fetch_symbols_by_ids")
-    @patch("extract.fetch_commodity_ids")
-    def test_handles_no_user_commodities(self, mock_fetch_ids, mock_fetch_symbols, mock_combine):
+    @patch("extract.fetch_user_symbols")
+    def test_handles_no_user_commodities(self, mock_fetch_symbols, mock_combine):
         """Should handle case where no users have commodities."""
-        mock_fetch_ids.return_value = []
         mock_fetch_symbols.return_value = []
         mock_combine.return_value = {"GCUSD"}  # Just defaults
 
         result = get_tracked_symbols()
 
-        mock_fetch_symbols.assert_called_once_with([])
+        mock_combine.assert_called_once_with([])
         assert result == {"GCUSD"}
+
+    @patch("extract.time.time")
+    @patch("extract.combine_symbols")
+    @patch("extract.fetch_user_symbols")
+    def test_reuses_symbols_within_ttl(self, mock_fetch_symbols, mock_combine, mock_time):
+        """Should only query the database once inside the same TTL window."""
+        mock_time.return_value = 1000
+        mock_combine.return_value = {"GCUSD"}
+
+        get_tracked_symbols()
+        mock_time.return_value = 1000 + SYMBOLS_TTL - 101
+        result = get_tracked_symbols()
+
+        mock_fetch_symbols.assert_called_once()
+        assert result == {"GCUSD"}
+
+    @patch("extract.time.time")
+    @patch("extract.combine_symbols")
+    @patch("extract.fetch_user_symbols")
+    def test_refetches_symbols_after_ttl(self, mock_fetch_symbols, mock_combine, mock_time):
+        """Should query the database again once the TTL window has passed."""
+        mock_time.return_value = 1000
+        mock_combine.return_value = {"GCUSD"}
+
+        get_tracked_symbols()
+        mock_time.return_value = 1000 + SYMBOLS_TTL
+        get_tracked_symbols()
+
+        assert mock_fetch_symbols.call_count == 2
+
+
+class TestGetCommodityDataBulk:
+    """Tests for get_commodity_data_bulk function."""
+
+    @patch.dict("os.environ", {"API_KEY": "test_key_123"})
+    @patch("extract.session.get")
+    def test_fetches_all_symbols_in_one_request(self, mock_get):
+        """Should request every symbol with a single API call."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = orjson.dumps([
+            {**SAMPLE_API_RESPONSE[0], "symbol": symbol}
+            for symbol in ("GCUSD", "CLUSD", "SIUSD")
+        ])
+        mock_get.return_value = mock_response
+
+        result = get_commodity_data_bulk(["GCUSD", "CLUSD", "SIUSD"])
+
+        mock_get.assert_called_once()
+        assert mock_get.call_args.kwargs["params"]["symbols"] == (
+            "GCUSD,CLUSD,SIUSD")
+        assert len(result) == 3
+
+
+class TestIterCommodities:
+    """Tests for iter_commodities function."""
+
+    @patch("extract.get_commodity_data_bulk")
+    @patch("extract.get_tracked_symbols")
+    def test_fetches_every_symbol_in_order(self, mock_symbols, mock_get_data):
+        """Should yield one batch per QUOTE_BATCH_SIZE symbols, in order."""
+        symbols = tuple(f"S{i:03}" for i in range(QUOTE_BATCH_SIZE + 2))
+        mock_symbols.return_value = symbols
+        mock_get_data.side_effect = lambda batch: [
+            {"symbol": symbol} for symbol in batch]
+
+        result = list(iter_commodities())
+
+        assert len(result) == 2
+        assert [r["symbol"] for batch in result for r in batch] == list(symbols)
+        assert {s for call in mock_get_data.call_args_list
+                for s in call.args[0]} == set(symbols)
+
+    @patch("extract.ThreadPoolExecutor")
+    @patch("extract.get_tracked_symbols")
+    def test_uses_one_worker_per_batch(self, mock_symbols, mock_executor):
+        """Should size the thread pool to the number of batches."""
+        mock_symbols.return_value = tuple(
+            f"S{i:03}" for i in range(2 * QUOTE_BATCH_SIZE + 1))
+        mock_executor.return_value.__enter__.return_value.map.return_value = []
+
+        list(iter_commodities())
+
+        mock_executor.assert_called_once_with(max_workers=3)
+
+    @patch("extract.get_commodity_data_bulk")
+    @patch("extract.get_tracked_symbols")
+    def test_yields_nothing_without_symbols(self, mock_symbols, mock_get_data):
+        """Should not make any request when no symbols are tracked."""
+        mock_symbols.return_value = ()
+
+        assert list(iter_commodities()) == []
+        mock_get_data.assert_not_called()
+
+
+class TestRecordsToFrame:
+    """Tests for records_to_frame function."""
+
+    def test_applies_schema_dtypes(self):
+        """Should give every numeric field its fixed dtype."""
+        result = records_to_frame(SAMPLE_API_RESPONSE)
+
+        for col, dtype in SCHEMA_DTYPES.items():
+            assert result[col].dtype == dtype, col
+
+    def test_dataframe_values_match_response(self):
+        """Should keep prices and volumes exactly as FMP sent them."""
+        result = records_to_frame(SAMPLE_API_RESPONSE)
+
+        assert result.iloc[0]["price"] == 3375.3
+        assert result.iloc[0]["volume"] == 170936
+        assert result.iloc[0]["timestamp"] == 1753372205
+
+    def test_keeps_dtypes_for_all_null_columns(self):
+        """Should not fall back to object columns when a field is null."""
+        result = records_to_frame(
+            [{**SAMPLE_API_RESPONSE[0], "volume": None, "change": None}])
+
+        assert result["volume"].dtype == "Int64"
+        assert result["volume"].isna().all()
+        assert result["change"].dtype == "float64"
+
+
+class TestLoopCommodities:
+    """Tests for loop_commodities function."""
+
+    @patch("extract.get_commodity_data_bulk")
+    @patch("extract.get_tracked_symbols")
+    def test_builds_one_dataframe_from_all_records(self, mock_symbols, mock_get_data):
+        """Should combine every symbol's records into a single DataFrame."""
+        mock_symbols.return_value = ("GCUSD", "SIUSD")
+        mock_get_data.return_value = [
+            SAMPLE_API_RESPONSE[0],
+            {**SAMPLE_API_RESPONSE[0], "symbol": "SIUSD"},
+        ]
+
+        result = loop_commodities()
+
+        assert isinstance(result, pd.DataFrame)
+        assert list(result["symbol"]) == ["GCUSD", "SIUSD"]
+
+    @patch("extract.get_commodity_data_bulk")
+    @patch("extract.get_tracked_symbols")
+    def test_dataframe_contains_expected_columns(self, mock_symbols, mock_get_data):
+        """Should contain all expected columns from API response."""
+        mock_symbols.return_value = ("GCUSD",)
+        mock_get_data.return_value = SAMPLE_API_RESPONSE
+
+        result = loop_commodities()
+
+        expected_cols = [
+            "symbol", "price", "changePercentage", "change",
+            "volume", "dayLow", "dayHigh", "yearHigh", "yearLow",
+            "priceAvg50", "priceAvg200", "open", "previousClose", "timestamp"
+        ]
+        for col in expected_cols:
+            assert col in result.columns, f"Missing column: {col}"
+        for col in ("name", "marketCap", "exchange"):
+            assert col not in result.columns, f"Unused column kept: {col}"
+
+    @patch("extract.get_commodity_data_bulk")
+    @patch("extract.get_tracked_symbols")
+    def test_returns_empty_dataframe_when_nothing_fetched(self, mock_symbols, mock_get_data):
+        """Should return an empty DataFrame when no symbol returns data."""
+        mock_symbols.return_value = ("GCUSD", "SIUSD")
+        mock_get_data.return_value = []
+
+        result = loop_commodities()
+
+        assert isinstance(result, pd.DataFrame)
+        assert result.empty
+        assert list(result.columns) == EXPECTED_COLS
@@ -2,17 +2,19 @@
 Tests for load.py functions
 """
 
-from unittest.mock import patch, MagicMock
+from datetime import datetime
+from unittest.mock import patch
 
 import pytest
 import pandas as pd
 
-from load import insert_into_db
+import load
+from load import insert_into_db, load_data, stream_into_db, FrameCsvReader
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def sample_df():
-    """Sample DataFrame matching market_records schema."""
+    """Sample DataFrame matching market_records schema; shared, never mutated."""
     return pd.DataFrame([{
         "commodity_id": 1,
         "recorded_at": pd.Timestamp("2026-02-03 14:57:16"),
@@ -28,116 +30,197 @@ def sample_df():
         "price_avg_200": 48.65,
         "year_high": 121.30,
         "year_low": 28.31,
-        "ingested_at": pd.Timestamp("2026-02-03 15:07:34"),
     }])
 
 
-class TestInsertIntoDb:
-    @patch("load.execute_batch")
-    @patch("load.get_conn")
-    def test_executes_insert_query(self, mock_get_conn, mock_execute_batch, sample_df):
-        """Should execute INSERT query with execute_batch."""
-        mock_cursor = MagicMock()
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+class TestLoadData:
+    """Tests for load_data function"""
+
+    def test_parses_timestamps_while_reading(self, tmp_path):
+        """Should read timestamp columns as datetimes, not strings."""
+        csv_path = tmp_path / "clean.csv"
+        csv_path.write_text(
+            "commodity_id,recorded_at,price\n"
+            "10,2026-02-03 16:09:33,66.83\n"
+        )
+
+        df = load_data(str(csv_path))
+
+        assert len(df) == 1
+        assert df["commodity_id"].iloc[0] == 10
+        assert df["recorded_at"].iloc[0] == pd.Timestamp("2026-02-03 16:09:33")
+
+    def test_reads_parquet_with_types_intact(self, tmp_path, sample_df):
+        """Should read Parquet output back with its column types."""
+        parquet_path = tmp_path / "clean.parquet"
+        sample_df.to_parquet(parquet_path, index=False)
 
+        df = load_data(str(parquet_path))
+
+        pd.testing.assert_frame_equal(df, sample_df)
+
+
+class TestInsertIntoDb:
+    @patch("load.execute_values")
+    def test_executes_insert_query(self, mock_execute_values, db_mocks, sample_df):
+        """Should insert every row with one execute_values call."""
         insert_into_db(sample_df)
 
-        mock_execute_batch.assert_called_once()
-        call_args = mock_execute_batch.call_args
+        mock_execute_values.assert_called_once()
+        call_args = mock_execute_values.call_args
         assert "INSERT INTO market_records" in call_args[0][1]
+        assert call_args[0][1].endswith("VALUES %s")
+        assert call_args.kwargs["page_size"] == 1000
 
-    @patch("load.execute_batch")
-    @patch("load.get_conn")
-    def test_passes_correct_rows(self, mock_get_conn, mock_execute_batch, sample_df):
+    @patch("load.execute_values")
+    def test_passes_correct_rows(self, mock_execute_values, db_mocks, sample_df):
         """Should pass DataFrame rows as tuples."""
-        mock_cursor = MagicMock()
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
-
         insert_into_db(sample_df)
 
-        call_args = mock_execute_batch.call_args
+        call_args = mock_execute_values.call_args
         rows = call_args[0][2]
         assert len(rows) == 1
         assert rows[0][0] == 1  # commodity_id
         assert rows[0][2] == 88.19  # price
 
-    @patch("load.execute_batch")
-    @patch("load.get_conn")
-    def test_commits_transaction(self, mock_get_conn, mock_execute_batch, sample_df):
+    @patch("load.execute_values")
+    def test_orders_rows_by_insert_columns(self, mock_execute_values, db_mocks, sample_df):
+        """Should pass values in INSERT column order whatever the frame order."""
+        shuffled = sample_df[list(reversed(sample_df.columns))]
+
+        insert_into_db(shuffled)
+
+        rows = mock_execute_values.call_args[0][2]
+        assert rows[0][0] == 1  # commodity_id
+        assert rows[0][2] == 88.19  # price
+        assert rows[0][-1] == 28.31  # year_low
+
+    @patch("load.execute_values")
+    def test_commits_transaction(self, mock_execute_values, db_mocks, sample_df):
         """Should commit after inserting."""
-        mock_cursor = MagicMock()
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+        mock_conn, _ = db_mocks
 
         insert_into_db(sample_df)
 
         mock_conn.commit.assert_called_once()
 
-    @patch("load.execute_batch")
-    @patch("load.get_conn")
-    def test_closes_cursor_and_connection(self, mock_get_conn, mock_execute_batch, sample_df):
-        """Should close cursor and connection."""
-        mock_cursor = MagicMock()
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    @patch("load.execute_values")
+    def test_closes_cursor_and_releases_connection(self, mock_execute_values, db_mocks, sample_df):
+        """Should close the cursor and hand the connection back to the pool."""
+        mock_conn, mock_cursor = db_mocks
 
         insert_into_db(sample_df)
 
         mock_cursor.close.assert_called_once()
-        mock_conn.close.assert_called_once()
+        mock_conn.close.assert_not_called()
+        load.get_conn.return_value.__exit__.assert_called_once()
 
-    @patch("load.execute_batch")
-    @patch("load.get_conn")
-    def test_handles_multiple_rows(self, mock_get_conn, mock_execute_batch):
+    @patch("load.execute_values")
+    def test_handles_multiple_rows(self, mock_execute_values, db_mocks):
         """Should handle DataFrame with multiple rows."""
-        mock_cursor = MagicMock()
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
-
         df = pd.DataFrame([
             {"commodity_id": 1, "recorded_at": pd.Timestamp.now(), "price": 100,
              "volume": 1000, "day_high": 105, "day_low": 95, "change": 2,
              "change_percentage": 0.02, "open_price": 98, "previous_close": 98,
              "price_avg_50": 99, "price_avg_200": 97, "year_high": 110,
-             "year_low": 85, "ingested_at": pd.Timestamp.now()},
+             "year_low": 85},
             {"commodity_id": 2, "recorded_at": pd.Timestamp.now(), "price": 200,
              "volume": 2000, "day_high": 205, "day_low": 195, "change": 3,
              "change_percentage": 0.015, "open_price": 198, "previous_close": 197,
              "price_avg_50": 199, "price_avg_200": 190, "year_high": 220,
-             "year_low": 180, "ingested_at": pd.Timestamp.now()},
+             "year_low": 180},
         ])
 
         insert_into_db(df)
 
-        call_args = mock_execute_batch.call_args
+        call_args = mock_execute_values.call_args
         rows = call_args[0][2]
         assert len(rows) == 2
 
-    @patch("load.execute_batch")
-    @patch("load.get_conn")
-    def test_handles_empty_dataframe(self, mock_get_conn, mock_execute_batch):
-        """Should handle empty DataFrame without error."""
-        mock_cursor = MagicMock()
-        mock_conn = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+    @patch("load.execute_values")
+    def test_converts_values_to_python_types(self, mock_execute_values, db_mocks, sample_df):
+        """Should pass plain Python values that psycopg2 can adapt."""
+        insert_into_db(sample_df)
+
+        row = mock_execute_values.call_args[0][2][0]
+        assert type(row[0]) is int  # commodity_id
+        assert type(row[2]) is float  # price
+        assert type(row[1]) is datetime  # recorded_at
+        assert row[1] == datetime(2026, 2, 3, 14, 57, 16)
 
+    @patch("load.execute_values")
+    def test_skips_database_for_empty_dataframe(self, mock_execute_values, db_mocks):
+        """Should not touch the database when there is nothing to insert."""
         df = pd.DataFrame(columns=[
             "commodity_id", "recorded_at", "price", "volume", "day_high",
             "day_low", "change", "change_percentage", "open_price",
             "previous_close", "price_avg_50", "price_avg_200", "year_high",
-            "year_low", "ingested_at"
+            "year_low"
         ])
 
         insert_into_db(df)
 
-        call_args = mock_execute_batch.call_args
-        rows = call_args[0][2]
-        assert len(rows) == 0
+        load.get_conn.assert_not_called()
+        mock_execute_values.assert_not_called()
+
+
+def _drain(reader, size=16):
+    """Reads a COPY source the way psycopg2 does, in fixed-size chunks."""
+    chunks = []
+    while chunk := reader.read(size):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+class TestFrameCsvReader:
+    """Tests for FrameCsvReader class"""
+
+    def test_renders_frames_as_headerless_csv(self, sample_df):
+        """Should emit one CSV line per record across all frames."""
+        reader = FrameCsvReader([sample_df, sample_df])
+
+        lines = _drain(reader).splitlines()
+
+        assert len(lines) == 2
+        assert lines[0].startswith("1,2026-02-03 14:57:16,88.19,")
+        assert reader.rows == 2
+
+    def test_renders_frames_lazily(self, sample_df):
+        """Should not pull the next frame until the buffer runs dry."""
+        pulled = []
+
+        def frames():
+            for i in range(3):
+                pulled.append(i)
+                yield sample_df
+
+        reader = FrameCsvReader(frames())
+        reader.read(1)
+
+        assert pulled == [0]
+
+
+class TestStreamIntoDb:
+    """Tests for stream_into_db function"""
+
+    def test_streams_all_frames_through_one_copy(self, db_mocks, sample_df):
+        """Should load every frame with a single COPY and commit once."""
+        mock_conn, mock_cursor = db_mocks
+        copied = []
+        mock_cursor.copy_expert.side_effect = lambda sql, f: copied.append(
+            _drain(f, 8192))
+
+        result = stream_into_db(iter([sample_df, sample_df]))
+
+        mock_cursor.copy_expert.assert_called_once()
+        assert "COPY market_records" in mock_cursor.copy_expert.call_args[0][0]
+        assert len(copied[0].splitlines()) == 2
+        mock_conn.commit.assert_called_once()
+        assert result == 2
+
+    def test_skips_database_when_nothing_to_load(self, db_mocks, sample_df):
+        """Should not open a connection when every frame is empty."""
+        result = stream_into_db(iter([sample_df.iloc[0:0]]))
+
+        load.get_conn.assert_not_called()
+        assert result == 0
@@ -0,0 +1,55 @@
+"""Script to test the pipeline module functions."""
+from unittest.mock import patch, MagicMock
+import orjson
+import pytest
+from extract import _get_api_key
+from pipeline import run_pipeline
+from sample_data import SAMPLE_API_RESPONSE
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    """Start every test without a cached API key."""
+    _get_api_key.cache_clear()
+    yield
+    _get_api_key.cache_clear()
+
+
+def quote_response(timestamp: int) -> MagicMock:
+    """A 200 response carrying the sample quote at the given timestamp."""
+    response = MagicMock()
+    response.status_code = 200
+    response.content = orjson.dumps(
+        [{**SAMPLE_API_RESPONSE[0], "timestamp": timestamp}])
+    return response
+
+
+class TestRunPipeline:
+    """Tests for run_pipeline function"""
+
+    @patch.dict("os.environ", {"API_KEY": "test_key_123"})
+    @patch("transform.get_symbol_id_map", return_value={"GCUSD": 1})
+    @patch("extract.get_tracked_symbols", return_value=("GCUSD",))
+    @patch("extract.session.get")
+    @patch("pipeline.stream_into_db")
+    def test_second_run_loads_fresh_quotes(
+            self, mock_stream, mock_get, _, __):
+        """A warm invocation should fetch afresh rather than load the
+        previous run's quotes again as duplicate rows."""
+        loaded = []
+
+        def stream(frames):
+            batch = list(frames)
+            loaded.append(batch)
+            return sum(len(frame) for frame in batch)
+
+        mock_stream.side_effect = stream
+        mock_get.side_effect = [quote_response(1753372205),
+                                quote_response(1753372265)]
+
+        run_pipeline()
+        run_pipeline()
+
+        assert mock_get.call_count == 2
+        first, second = (batch[0]["recorded_at"].tolist() for batch in loaded)
+        assert first != second
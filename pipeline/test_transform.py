@@ -7,13 +7,15 @@ import pytest
 import pandas as pd
 
 from transform import (
-    rename_columns,
-    unix_to_datetime,
-    remove_dead_columns,
-    create_ingested_column,
+    load_data,
+    seconds_to_datetime,
     get_symbol_id_map,
-    replace_symbol_with_id,
-    reorder_columns,
+    _cached_symbol_id_map,
+    SYMBOL_MAP_TTL,
+    symbols_to_ids,
+    apply_transformations,
+    downcast_integers,
+    RAW_COLUMN_TYPES,
 )
 
 
@@ -40,62 +42,54 @@ def sample_raw_df():
     }])
 
 
-class TestRenameColumns:
-    """Tests for rename_columns function"""
+class TestLoadData:
+    """Tests for load_data function"""
 
-    def test_renames_columns_correctly(self, sample_raw_df):
-        result = rename_columns(sample_raw_df)
-
-        assert "recorded_at" in result.columns
-        assert "timestamp" not in result.columns
-        assert "day_high" in result.columns
-        assert "dayHigh" not in result.columns
-        assert result["day_high"].iloc[0] == 3401.1
-
-
-class TestUnixToDatetime:
-    """Tests for unix_to_datetime function"""
-
-    def test_converts_and_preserves_precision(self):
-        df = pd.DataFrame([{"timestamp": 0}])
-
-        result = unix_to_datetime(df, "timestamp")
-
-        assert result["timestamp"].iloc[0] == pd.Timestamp("1970-01-01")
-        assert result["timestamp"].dtype == "datetime64[s]"
-
-
-class TestRemoveDeadColumns:
-    """Tests for remove_dead_columns function"""
+    def test_reads_raw_csv_with_fixed_types(self, tmp_path):
+        csv_path = tmp_path / "dirty.csv"
+        csv_path.write_text(
+            "symbol,name,price,volume,marketCap,timestamp\n"
+            "GCUSD,Gold,3375.3,170936,,1753372205\n"
+            "SIUSD,Silver,38.1,,,1753372205\n"
+        )
 
-    def test_removes_dead_columns(self, sample_raw_df):
-        result = remove_dead_columns(sample_raw_df)
+        result = load_data(str(csv_path))
 
-        assert "marketCap" not in result.columns
-        assert "exchange" not in result.columns
+        assert list(result["symbol"]) == ["GCUSD", "SIUSD"]
+        assert result["price"].dtype == "float64"
         assert "name" not in result.columns
+        assert "marketCap" not in result.columns
+        assert list(result.columns) == list(RAW_COLUMN_TYPES)
+        assert result["volume"].dtype == "Int64"
+        assert pd.isna(result["volume"].iloc[1])
+        assert result["timestamp"].iloc[0] == 1753372205
 
-    def test_handles_missing_columns(self):
-        df = pd.DataFrame([{"commodity_id": "10"}])
-        result = remove_dead_columns(df)
-        assert "commodity_id" in result.columns
 
+class TestSecondsToDatetime:
+    """Tests for seconds_to_datetime function"""
 
-class TestCreateIngestedColumn:
-    """Tests for create_ingested_column function"""
+    def test_converts_and_preserves_precision(self):
+        result = seconds_to_datetime(pd.Series([0]))
 
-    def test_adds_datetime_column(self):
-        df = pd.DataFrame([{"symbol": "GCUSD"}, {"symbol": "CLUSD"}])
+        assert result.iloc[0] == pd.Timestamp("1970-01-01")
+        assert result.dtype == "datetime64[s]"
 
-        result = create_ingested_column(df)
+    def test_keeps_missing_timestamps_as_nat(self):
+        seconds = pd.Series(pd.array([1753372205, None], dtype="Int64"))
 
-        assert "ingested_at" in result.columns
-        assert result["ingested_at"].dtype == "datetime64[s]"
-        assert result["ingested_at"].nunique() == 1
+        result = seconds_to_datetime(seconds)
+
+        assert result.dtype == "datetime64[s]"
+        assert result.iloc[0] == pd.Timestamp("2025-07-24 15:50:05")
+        assert pd.isna(result.iloc[1])
 
 
 class TestGetSymbolIdMap:
     """Tests for get_symbol_id_map function"""
+
+    def setup_method(self):
+        _cached_symbol_id_map.cache_clear()
+
     @patch("transform.get_conn")
     def test_returns_symbol_to_id_mapping(self, mock_get_conn):
         mock_cursor = MagicMock()
@@ -103,13 +97,14 @@ class TestGetSymbolIdMap:
             ("GCUSD", 1), ("CLUSD", 2), ("SIUSD", 3)]
         mock_conn = MagicMock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+        mock_get_conn.return_value.__enter__.return_value = mock_conn
 
         result = get_symbol_id_map()
 
         assert result == {"GCUSD": 1, "CLUSD": 2, "SIUSD": 3}
         mock_cursor.close.assert_called_once()
-        mock_conn.close.assert_called_once()
+        mock_conn.close.assert_not_called()
+        mock_get_conn.return_value.__exit__.assert_called_once()
 
     @patch("transform.get_conn")
     def test_returns_empty_dict_for_no_commodities(self, mock_get_conn):
@@ -117,13 +112,14 @@ class TestGetSymbolIdMap:
         mock_cursor.fetchall.return_value = []
         mock_conn = MagicMock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+        mock_get_conn.return_value.__enter__.return_value = mock_conn
 
         result = get_symbol_id_map()
 
         assert result == {}
         mock_cursor.close.assert_called_once()
-        mock_conn.close.assert_called_once()
+        mock_conn.close.assert_not_called()
+        mock_get_conn.return_value.__exit__.assert_called_once()
 
     @patch("transform.get_conn")
     def test_executes_correct_query(self, mock_get_conn):
@@ -131,7 +127,7 @@ class TestGetSymbolIdMap:
         mock_cursor.fetchall.return_value = [("GCUSD", 1)]
         mock_conn = MagicMock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_get_conn.return_value = mock_conn
+        mock_get_conn.return_value.__enter__.return_value = mock_conn
 
         get_symbol_id_map()
 
@@ -139,55 +135,114 @@ class TestGetSymbolIdMap:
             "SELECT symbol, commodity_id FROM commodities;"
         )
 
+    @patch("transform.time.time")
+    @patch("transform.get_conn")
+    def test_reuses_mapping_within_ttl(self, mock_get_conn, mock_time):
+        mock_conn = mock_get_conn.return_value.__enter__.return_value
+        mock_conn.cursor.return_value.fetchall.return_value = [("GCUSD", 1)]
+        mock_time.return_value = 1000
+
+        get_symbol_id_map()
+        mock_time.return_value = 1000 + SYMBOL_MAP_TTL - 101
+        result = get_symbol_id_map()
+
+        mock_get_conn.assert_called_once()
+        assert result == {"GCUSD": 1}
+
+    @patch("transform.time.time")
+    @patch("transform.get_conn")
+    def test_refetches_mapping_after_ttl(self, mock_get_conn, mock_time):
+        mock_conn = mock_get_conn.return_value.__enter__.return_value
+        mock_conn.cursor.return_value.fetchall.return_value = []
+        mock_time.return_value = 1000
+
+        get_symbol_id_map()
+        mock_time.return_value = 1000 + SYMBOL_MAP_TTL
+        get_symbol_id_map()
+
+        assert mock_get_conn.call_count == 2
+
 
-class TestReplaceSymbolWithId:
-    """Tests for replace_symbol_with_id function"""
+class TestSymbolsToIds:
+    """Tests for symbols_to_ids function"""
     @patch("transform.get_symbol_id_map")
-    def test_replaces_symbol_with_id(self, mock_map):
+    def test_looks_up_ids(self, mock_map):
         mock_map.return_value = {"GCUSD": 1, "CLUSD": 2}
-        df = pd.DataFrame([{"symbol": "GCUSD", "price": 100}, {
-                          "symbol": "CLUSD", "price": 80}])
 
-        result = replace_symbol_with_id(df)
+        result = symbols_to_ids(pd.Series(["GCUSD", "CLUSD"]))
+
+        assert list(result) == [1, 2]
+        assert result.dtype == "int64"
+
+    @patch("transform.get_symbol_id_map")
+    def test_unknown_symbol_gets_no_id(self, mock_map):
+        mock_map.return_value = {"GCUSD": 1}
+
+        result = symbols_to_ids(pd.Series(["XXUSD", "GCUSD"]))
+
+        assert pd.isna(result[0])
+        assert result[1] == 1
+
+
+class TestDowncastIntegers:
+    """Tests for downcast_integers function"""
 
-        assert "commodity_id" in result.columns
-        assert "symbol" not in result.columns
-        assert list(result["commodity_id"]) == [1, 2]
+    def test_downcasts_without_changing_values(self):
+        df = pd.DataFrame({
+            "commodity_id": [1, 2],
+            "volume": pd.array([170936, None], dtype="Int64"),
+            "price": [3375.3, 38.1],
+        })
 
+        result = downcast_integers(df)
 
-class TestReorderColumns:
-    """Tests for reorder_columns function"""
+        assert result["commodity_id"].dtype == "int8"
+        assert result["volume"].dtype == "Int32"
+        assert result["volume"].iloc[0] == 170936
+        assert pd.isna(result["volume"].iloc[1])
+        assert result["price"].dtype == "float64"
 
-    def test_reorders_to_schema(self):
-        df = pd.DataFrame([{
-            "price": 100, "commodity_id": 1, "volume": 500,
-            "recorded_at": pd.Timestamp.now(), "day_high": 105, "day_low": 95,
-            "change": 2, "change_percentage": 0.02, "open_price": 98,
-            "previous_close": 98, "price_avg_50": 99, "price_avg_200": 97,
-            "year_high": 110, "year_low": 85, "ingested_at": pd.Timestamp.now(),
-        }])
+    def test_keeps_int64_when_values_need_it(self):
+        df = pd.DataFrame({"commodity_id": [1], "volume": [2 ** 40]})
 
-        result = reorder_columns(df)
+        result = downcast_integers(df)
 
-        assert result.columns[0] == "commodity_id"
-        assert result.columns[-1] == "ingested_at"
-        assert len(result.columns) == 15
+        assert result["volume"].dtype == "int64"
+        assert result["volume"].iloc[0] == 2 ** 40
 
 
 class TestFullTransformation:
     """Tests for the full transformation pipeline"""
     @patch("transform.get_symbol_id_map")
-    def test_transforms_raw_to_final(self, mock_map, sample_raw_df):
+    def test_apply_transformations_builds_expected_frame(self, mock_map, sample_raw_df):
         mock_map.return_value = {"GCUSD": 42}
 
-        df = rename_columns(sample_raw_df)
-        df = unix_to_datetime(df, "recorded_at")
-        df = remove_dead_columns(df)
-        df = create_ingested_column(df)
-        df = replace_symbol_with_id(df)
-        df = reorder_columns(df)
-
-        assert len(df.columns) == 15
-        assert df["commodity_id"].iloc[0] == 42
-        assert "symbol" not in df.columns
-        assert "marketCap" not in df.columns
+        result = apply_transformations(sample_raw_df)
+
+        expected = pd.DataFrame({
+            "commodity_id": pd.array([42], dtype="int8"),
+            "recorded_at": pd.array(
+                [pd.Timestamp("2025-07-24 15:50:05")], dtype="datetime64[s]"),
+            "price": [3375.3],
+            "volume": pd.array([170936], dtype="int32"),
+            "day_high": [3401.1],
+            "day_low": [3355.2],
+            "change": [-22.3],
+            "change_percentage": [-0.65635],
+            "open_price": [3398.6],
+            "previous_close": [3397.6],
+            "price_avg_50": [3358.706],
+            "price_avg_200": [3054.501],
+            "year_high": [3509.9],
+            "year_low": [2354.6],
+        })
+        pd.testing.assert_frame_equal(result, expected)
+
+    @patch("transform.get_symbol_id_map")
+    def test_apply_transformations_leaves_input_untouched(self, mock_map, sample_raw_df):
+        mock_map.return_value = {"GCUSD": 42}
+
+        apply_transformations(sample_raw_df)
+
+        assert "symbol" in sample_raw_df.columns
+        assert "timestamp" in sample_raw_df.columns
@@ -1,10 +1,16 @@
 """Script to transform record data ready for upload."""
 # pylint: disable=redefined-outer-name
 import logging
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 from os import environ as ENV
 import pandas as pd
 import numpy as np
-from psycopg2 import connect
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from pyarrow import parquet as pq
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 logging.basicConfig(
@@ -13,126 +19,182 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# column types of the raw FMP quote CSV fields that are kept, so pyarrow
+# never has to infer them; name, marketCap and exchange are never parsed
+RAW_COLUMN_TYPES = {
+    "symbol": pa.string(),
+    "price": pa.float64(),
+    "changePercentage": pa.float64(),
+    "change": pa.float64(),
+    "volume": pa.int64(),
+    "dayLow": pa.float64(),
+    "dayHigh": pa.float64(),
+    "yearHigh": pa.float64(),
+    "yearLow": pa.float64(),
+    "priceAvg50": pa.float64(),
+    "priceAvg200": pa.float64(),
+    "open": pa.float64(),
+    "previousClose": pa.float64(),
+    "timestamp": pa.int64(),
+}
+
+# how long, in seconds, a warm process may reuse the symbol -> id mapping
+SYMBOL_MAP_TTL = 300
+
+# raw FMP field -> market_records column, for the fields that are renamed
+COLUMNS_MAP = {
+    "timestamp": "recorded_at",
+    "dayHigh": "day_high",
+    "dayLow": "day_low",
+    "yearHigh": "year_high",
+    "yearLow": "year_low",
+    "changePercentage": "change_percentage",
+    "open": "open_price",
+    "previousClose": "previous_close",
+    "priceAvg50": "price_avg_50",
+    "priceAvg200": "price_avg_200",
+}
+
+# whole-number market_records columns, safe to store in narrower types
+INTEGER_COLUMNS = ["commodity_id", "volume"]
+
+# market_records columns in table order
+COLUMN_ORDER = [
+    "commodity_id",
+    "recorded_at",
+    "price",
+    "volume",
+    "day_high",
+    "day_low",
+    "change",
+    "change_percentage",
+    "open_price",
+    "previous_close",
+    "price_avg_50",
+    "price_avg_200",
+    "year_high",
+    "year_low",
+]
+
 
 def load_data(file_path: str) -> pd.DataFrame:
     """Loads data from a CSV file into a DataFrame."""
     logger.info("Loading data from %s", file_path)
-    df = pd.read_csv(file_path)
+    table = pa_csv.read_csv(
+        file_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types=RAW_COLUMN_TYPES,
+            include_columns=list(RAW_COLUMN_TYPES),
+            include_missing_columns=True,
+        ),
+    )
+    # nullable Int64 keeps volume and timestamp whole when values are missing
+    df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
     logger.info("Loaded %d records from %s", len(df), file_path)
     return df
 
 
-def get_conn():
-    """Establishes and returns a connection to the PostgreSQL database."""
-    logger.debug("Establishing database connection")
-    conn = connect(
+@lru_cache(maxsize=1)
+def get_pool() -> ThreadedConnectionPool:
+    """Creates the shared PostgreSQL connection pool on first use."""
+    logger.debug("Creating database connection pool")
+    return ThreadedConnectionPool(
+        1, 8,
         dbname=ENV.get("DB_NAME"),
         user=ENV.get("DB_USER"),
         password=ENV.get("DB_PASSWORD"),
         host=ENV.get("DB_HOST"),
         port=ENV.get("DB_PORT"),
     )
-    logger.debug("Database connection established successfully")
-    return conn
-
-
-def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Renames columns in the DataFrame based on the provided mapping."""
-    logger.debug("Renaming columns")
-    columns_map = {
-        "timestamp": "recorded_at",
-        "dayHigh": "day_high",
-        "dayLow": "day_low",
-        "yearHigh": "year_high",
-        "yearLow": "year_low",
-        "changePercentage": "change_percentage",
-        "open": "open_price",
-        "previousClose": "previous_close",
-        "priceAvg50": "price_avg_50",
-        "priceAvg200": "price_avg_200"
-
-    }
-    return df.rename(columns=columns_map)
 
 
-def unix_to_datetime(df: pd.DataFrame, column: str) -> pd.DataFrame:
-    """Converts a UNIX timestamp column to datetime format."""
-    logger.debug(
-        "Converting %s column from UNIX timestamp to datetime", column)
+@contextmanager
+def get_conn():
+    """Yields a pooled connection to the PostgreSQL database."""
+    logger.debug("Taking connection from pool")
+    conn = get_pool().getconn()
+    try:
+        yield conn
+    finally:
+        get_pool().putconn(conn)
+        logger.debug("Connection returned to pool")
+
+
+def seconds_to_datetime(seconds: pd.Series) -> pd.Series:
+    """Converts seconds since the epoch to a datetime64[s] Series."""
+    if pd.api.types.is_integer_dtype(seconds) and not seconds.hasnans:
+        # whole seconds already are datetime64[s] ticks: reinterpret the
+        # int64 buffer instead of converting through nanoseconds
+        values = seconds.to_numpy(dtype='int64').view('datetime64[s]')
+        return pd.Series(values, index=seconds.index, name=seconds.name)
     # convert from seconds since epoch and cast to seconds precision
-    df[column] = pd.to_datetime(df[column], unit='s').astype('datetime64[s]')
-    return df
-
-
-def remove_dead_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Removes specified dead columns from the DataFrame."""
-    dead_columns = ["marketCap", "exchange", "name"]
-    logger.debug("Removing dead columns: %s", dead_columns)
-    return df.drop(columns=dead_columns, errors='ignore')
-
-
-def create_ingested_column(df: pd.DataFrame) -> pd.DataFrame:
-    """Creates an 'ingested_at' column with the current timestamp."""
-    logger.debug("Creating ingested_at column")
-    # set ingestion time with seconds precision to match `recorded_at`
-    ts = np.datetime64('now', 's')
-    df['ingested_at'] = pd.Series(ts, index=df.index, dtype='datetime64[s]')
-    return df
+    return pd.to_datetime(seconds, unit='s').astype('datetime64[s]')
+
+
+@lru_cache(maxsize=1)
+def _cached_symbol_id_map(ttl_bucket: int) -> dict:
+    """Fetches the symbol mappings once per `ttl_bucket` time window."""
+    logger.info("Fetching symbol to commodity_id mappings for window %d",
+                ttl_bucket)
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT symbol, commodity_id FROM commodities;")
+        result = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.close()
+    logger.info("Fetched %d symbol mappings", len(result))
+    return result
 
 
 def get_symbol_id_map() -> dict:
-    """Fetch all symbol -> commodity_id mappings."""
-    logger.info("Fetching symbol to commodity_id mappings")
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT symbol, commodity_id FROM commodities;")
-    result = {row[0]: row[1] for row in cursor.fetchall()}
-    cursor.close()
-    conn.close()
-    logger.info("Fetched %d symbol mappings", len(result))
-    return result
+    """Fetch all symbol -> commodity_id mappings, hitting the database at
+    most once every SYMBOL_MAP_TTL seconds."""
+    return _cached_symbol_id_map(int(time.time() // SYMBOL_MAP_TTL))
 
 
-def replace_symbol_with_id(df: pd.DataFrame) -> pd.DataFrame:
-    """Replaces the 'symbol' column with 'commodity_id' in the DataFrame."""
-    logger.debug("Replacing symbol column with commodity_id")
+def symbols_to_ids(symbols: pd.Series) -> np.ndarray:
+    """Looks up the commodity_id of every symbol, NaN where unknown."""
     symbol_map = get_symbol_id_map()
-    df['commodity_id'] = df['symbol'].map(symbol_map)
-    return df.drop(columns=['symbol'])
-
-
-def reorder_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Reorders DataFrame columns to match the target schema."""
-    logger.debug("Reordering columns to match target schema")
-    column_order = [
-        "commodity_id",
-        "recorded_at",
-        "price",
-        "volume",
-        "day_high",
-        "day_low",
-        "change",
-        "change_percentage",
-        "open_price",
-        "previous_close",
-        "price_avg_50",
-        "price_avg_200",
-        "year_high",
-        "year_low",
-        "ingested_at",
-    ]
-    return df[column_order]
+    # hash the symbols once into positional codes, then take the ids by
+    # position; unknown symbols get code -1, which picks the trailing NaN
+    codes = pd.Index(list(symbol_map)).get_indexer(symbols)
+    ids = np.fromiter(symbol_map.values(), dtype='int64', count=len(symbol_map))
+    if (codes < 0).any():
+        ids = np.append(ids.astype('float64'), np.nan)
+    return ids[codes]
+
+
+def downcast_integers(df: pd.DataFrame) -> pd.DataFrame:
+    """Shrinks the integer columns to the smallest type holding every value.
+
+    Only whole-number columns are downcast, so nothing is ever rounded; the
+    float columns stay float64 to match the FLOAT (double) table columns.
+    """
+    logger.debug("Downcasting integer columns: %s", INTEGER_COLUMNS)
+    for column in INTEGER_COLUMNS:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
 
 
 def apply_transformations(df: pd.DataFrame) -> pd.DataFrame:
-    """Applies all transformation functions to the DataFrame."""
+    """Applies all transformations to the DataFrame in a single projection.
+
+    Renames the raw FMP fields to their market_records columns, converts
+    the UNIX timestamp to recorded_at, replaces symbol with commodity_id
+    and orders the columns as in the table, then downcasts the integer
+    columns, without an intermediate DataFrame per step.
+    """
     logger.info("Starting data transformations on %d records", len(df))
-    df = rename_columns(df)
-    df = unix_to_datetime(df, "recorded_at")
-    df = remove_dead_columns(df)
-    df = create_ingested_column(df)
-    df = replace_symbol_with_id(df)
-    df = reorder_columns(df)
+    source = {new: old for old, new in COLUMNS_MAP.items()}
+    columns = {
+        column: df[source.get(column, column)]
+        for column in COLUMN_ORDER
+        if column not in ("commodity_id", "recorded_at")
+    }
+    columns["commodity_id"] = symbols_to_ids(df["symbol"])
+    columns["recorded_at"] = seconds_to_datetime(df["timestamp"])
+    df = pd.DataFrame({column: columns[column] for column in COLUMN_ORDER},
+                      index=df.index)
+    df = downcast_integers(df)
     logger.info("Completed all transformations, %d records processed", len(df))
     return df
 
@@ -142,6 +204,7 @@ if __name__ == "__main__":
     logger.info("Starting transformation script")
     df = load_data("dirty_commodity_data.csv")
     df = apply_transformations(df)
-    df.to_csv("clean_commodity_data.csv", index=False)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                   "clean_commodity_data.parquet", compression="snappy")
     logger.info(
-        "Transformation complete. Data saved to clean_commodity_data.csv")
+        "Transformation complete. Data saved to clean_commodity_data.parquet")
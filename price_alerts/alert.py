@@ -1,14 +1,26 @@
 """Script to check the RDS for alert conditions
  and send alerts based on previous Lambda"""
 from os import environ as ENV
+import io
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from email.generator import BytesGenerator
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
+from email.policy import SMTP
 
 from dotenv import load_dotenv
-from psycopg2 import connect, DatabaseError, OperationalError
+import pandas as pd
+from psycopg2 import DatabaseError, OperationalError
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
 import boto3
+from botocore.config import Config
 
 from generate_alert import generate_alert_email, get_logo_bytes
 
@@ -16,215 +28,286 @@ from generate_alert import generate_alert_email, get_logo_bytes
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# once per container, before any settings below are read
+load_dotenv()
 
-def get_conn():
-    """Establishes and returns a connection to the PostgreSQL database."""
-    conn = connect(
-        dbname=ENV.get("DB_NAME"),
-        user=ENV.get("DB_USER"),
-        password=ENV.get("DB_PASSWORD"),
-        host=ENV.get("DB_HOST"),
-        port=ENV.get("DB_PORT"),
-    )
-    return conn
+# upper bound on SES sends in flight at once
+SEND_WORKERS = 14
 
+# the SES account's maximum send rate, in emails per second
+SES_MAX_SEND_RATE = float(ENV.get("SES_MAX_SEND_RATE", "14"))
 
-def get_user_commodities() -> list[dict]:
-    """Fetch all user commodities data and return as a list of dictionaries
+# how long, in seconds, customer email and commodity names are reused
+CUSTOMER_INFO_TTL = int(ENV.get("CUSTOMER_INFO_TTL", "300"))
 
-    Returns:
-        list[dict]: List of user commodity dictionaries
+# (user_id, commodity_id) -> (monotonic expiry time, customer info row)
+customer_cache = {}
 
-    Raises:
-        DatabaseError: If database query fails
-    """
-    conn = None
-    try:
-        conn = get_conn()
-        query = """
-            SELECT * FROM user_commodities
-            WHERE (buy_price IS NOT NULL OR sell_price IS NOT NULL)
-            AND (alerted_at IS NULL OR alerted_at < NOW() - INTERVAL '2 hours');"""
-        cur = conn.cursor()
+# room for every send worker plus the verified address lookup, so no
+# thread waits on a connection; adaptive retries back off when throttled
+SES_CONFIG = Config(
+    max_pool_connections=SEND_WORKERS + 6,
+    retries={'max_attempts': 3, 'mode': 'adaptive'},
+)
 
-        try:
-            cur.execute(query)
-            rows = cur.fetchall()
-            columns = [desc[0] for desc in cur.description]
-            result = [dict(zip(columns, row)) for row in rows]
-            logger.info(
-                "Retrieved %d user commodities for alert checking", len(result))
-            return result
-        finally:
-            cur.close()
-    except (DatabaseError, OperationalError) as e:
-        logger.error("Database error fetching user commodities: %s", e)
-        raise
-    finally:
-        if conn is not None:
-            conn.close()
 
+class SendPacer:
+    """Thread-safe pacer that spaces callers 1/`rate` seconds apart, the
+    first one included, so no one-second window sees more than `rate`.
 
-def get_latest_prices(event: dict) -> dict:
-    """Fetch latest prices for all commodities"""
-    prices_list = event["body"]
-    return {
-        commodity_price['commodity_id']: commodity_price for commodity_price in prices_list}
+    The lock only guards the slot arithmetic; callers sleep outside it.
+    """
 
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = time.monotonic() + self.interval
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Claims the next send slot, sleeping until it arrives"""
+        with self._lock:
+            now = time.monotonic()
+            # slots left unused are not carried forward, so a stall
+            # cannot bank credit for a later burst
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+@lru_cache(maxsize=1)
+def get_pool() -> ThreadedConnectionPool:
+    """Creates the shared PostgreSQL connection pool on first use, so warm
+    Lambda invocations reuse its connections."""
+    return ThreadedConnectionPool(
+        1, 10,
+        dbname=ENV.get("DB_NAME"),
+        user=ENV.get("DB_USER"),
+        password=ENV.get("DB_PASSWORD"),
+        host=ENV.get("DB_HOST"),
+        port=ENV.get("DB_PORT"),
+    )
 
-def check_one_alert(user_commodity: dict, commodity_price: dict) -> tuple:
-    """Check if an alert condition is met for the user commodity"""
-    if commodity_price is None:
-        return None
 
-    buy_price = user_commodity.get("buy_price")
-    sell_price = user_commodity.get("sell_price")
+@contextmanager
+def get_conn():
+    """Yields a pooled connection to the PostgreSQL database."""
+    conn = get_pool().getconn()
+    try:
+        yield conn
+    finally:
+        get_pool().putconn(conn)
 
-    if buy_price is not None and commodity_price['price'] <= buy_price:
-        return ('buy', user_commodity)
-    if sell_price is not None and commodity_price['price'] >= sell_price:
-        return ('sell', user_commodity)
-    return None
 
+@lru_cache(maxsize=1)
+def get_ses_client():
+    """Creates the SES client on first use, so warm Lambda invocations skip
+    credential discovery and reuse its open connections."""
+    return boto3.client('ses', region_name='eu-west-2', config=SES_CONFIG)
 
-def check_all_alerts(user_commodities: list[dict], latest_prices: dict) -> list[tuple]:
-    """Check all user commodities against latest prices for alerts"""
-    alerts = []
 
-    for user_commodity in user_commodities:
-        action = check_one_alert(user_commodity, latest_prices.get(
-            user_commodity['commodity_id']))
-        if action is not None:
-            alerts.append(action)
+def get_user_commodities(latest_prices: dict) -> pd.DataFrame:
+    """Fetch the user commodities whose alert price is crossed by the
+    latest prices as a DataFrame
 
-    return alerts
+    The prices are joined in as arrays so PostgreSQL only returns rows
+    that will alert, and those rows are streamed out with COPY and parsed
+    in bulk rather than converted to Python objects one cell at a time.
+    A buy alert triggers at or below the buy price and a sell alert at or
+    above the sell price; the query labels each row with its alert_type,
+    buy taking precedence when both are crossed.
 
+    Args:
+        latest_prices: {commodity_id: price} from get_latest_prices
 
-def get_required_customer_info(action: tuple, latest_prices: dict) -> dict:
-    """Get all the required customer info for sending alert
+    Returns:
+        pd.DataFrame: One row per user commodity due an alert
 
     Raises:
         DatabaseError: If database query fails
-        ValueError: If query returns no results
     """
-    alert_type, user_commodity = action
-    user_id = user_commodity['user_id']
-    commodity_id = user_commodity['commodity_id']
-
-    conn = None
     try:
-        conn = get_conn()
-        cur = conn.cursor()
+        with get_conn() as conn:
+            cur = conn.cursor()
 
-        try:
-            cur.execute("""
-                SELECT u.email, u.user_name, c.symbol, c.commodity_name
-                FROM users u
-                JOIN user_commodities uc ON u.user_id = uc.user_id
-                JOIN commodities c ON uc.commodity_id = c.commodity_id
-                WHERE u.user_id = %s AND c.commodity_id = %s
-            """, (user_id, commodity_id))
-
-            row = cur.fetchone()
-
-            if row is None:
-                logger.error("No customer info found for user_id=%s, commodity_id=%s",
-                             user_id, commodity_id)
-                raise ValueError(
-                    f"No customer info found for user_id={user_id}, commodity_id={commodity_id}"
+            try:
+                # COPY takes no bind parameters, so the arrays are inlined
+                query = cur.mogrify("""
+                    COPY (
+                        SELECT uc.user_id, uc.commodity_id,
+                               uc.buy_price, uc.sell_price,
+                               CASE WHEN lp.price <= uc.buy_price
+                                    THEN 'buy' ELSE 'sell' END AS alert_type
+                        FROM user_commodities uc
+                        JOIN unnest(%s::bigint[], %s::float8[])
+                            AS lp(commodity_id, price)
+                            ON lp.commodity_id = uc.commodity_id
+                        WHERE (uc.buy_price IS NOT NULL OR uc.sell_price IS NOT NULL)
+                        AND (uc.alerted_at IS NULL OR uc.alerted_at < NOW() - INTERVAL '2 hours')
+                        AND (lp.price <= uc.buy_price OR lp.price >= uc.sell_price)
+                    ) TO STDOUT WITH (FORMAT csv, HEADER);""",
+                    (list(latest_prices), list(latest_prices.values()))
+                ).decode()
+                buffer = io.StringIO()
+                cur.copy_expert(query, buffer)
+                buffer.seek(0)
+                result = pd.read_csv(
+                    buffer,
+                    dtype={"buy_price": "float64", "sell_price": "float64"},
                 )
-
-            return {
-                "alert_type": alert_type,
-                "email": row[0],
-                "user_name": row[1],
-                "symbol": row[2],
-                "commodity_name": row[3],
-                "current_price": latest_prices[commodity_id]['price'],
-                "target_price": user_commodity['buy_price'] if alert_type == 'buy' else user_commodity['sell_price'],
-                "user_id": user_id,
-                "commodity_id": commodity_id
-            }
-        finally:
-            cur.close()
+                logger.info(
+                    "Retrieved %d user commodities crossing their alert prices",
+                    len(result))
+                return result
+            finally:
+                cur.close()
     except (DatabaseError, OperationalError) as e:
-        logger.error("Database error getting customer info for user_id=%s, commodity_id=%s: %s",
-                     user_id, commodity_id, e)
+        logger.error("Database error fetching user commodities: %s", e)
         raise
-    finally:
-        if conn is not None:
-            conn.close()
+
+
+def get_latest_prices(event: dict) -> dict:
+    """Fetch latest prices for all commodities as {commodity_id: price}"""
+    return {
+        commodity_price['commodity_id']: commodity_price['price']
+        for commodity_price in event["body"]}
+
+
+def check_all_alerts(user_commodities: pd.DataFrame) -> list[tuple]:
+    """Pair each alerting user commodity row with its alert type"""
+    if user_commodities.empty:
+        return []
+
+    alert_types = user_commodities["alert_type"].tolist()
+    rows = user_commodities.drop(columns="alert_type").to_dict("records")
+    return list(zip(alert_types, rows))
 
 
 def get_all_required_customer_info(actions: list[tuple], latest_prices: dict) -> list[dict]:
-    """Get required customer info for all alerts
+    """Get required customer info for all alerts with a single query
 
+    Customer info looked up within the last CUSTOMER_INFO_TTL seconds is
+    served from memory and left out of the query. Expired entries are
+    evicted whenever fresh rows are cached.
     Skips alerts where customer info cannot be retrieved and logs errors.
 
     Returns:
         list[dict]: List of customer info dictionaries for successful lookups
     """
+    if not actions:
+        return []
+
+    now = time.monotonic()
+    customers = {}
+    missing = []
+    for pair in {(user_commodity['user_id'], user_commodity['commodity_id'])
+                 for _, user_commodity in actions}:
+        cached = customer_cache.get(pair)
+        if cached is not None and cached[0] > now:
+            customers[pair] = cached[1]
+        else:
+            missing.append(pair)
+
+    if missing:
+        try:
+            with get_conn() as conn:
+                cur = conn.cursor()
+
+                try:
+                    rows = execute_values(cur, """
+                        SELECT u.user_id, c.commodity_id, u.email, u.user_name,
+                               c.symbol, c.commodity_name
+                        FROM users u
+                        JOIN user_commodities uc ON u.user_id = uc.user_id
+                        JOIN commodities c ON uc.commodity_id = c.commodity_id
+                        WHERE (u.user_id, c.commodity_id) IN (VALUES %s)
+                    """, missing, fetch=True)
+                finally:
+                    cur.close()
+        except (DatabaseError, OperationalError) as e:
+            # Database error - log as error and skip every alert
+            logger.error(
+                "Skipping %d alerts - database error getting customer info: %s",
+                len(actions), e)
+            return []
+
+        # drop expired entries as new ones go in, so the cache only holds
+        # rows looked up within the last CUSTOMER_INFO_TTL seconds
+        now = time.monotonic()
+        for pair in [pair for pair, (expiry, _) in customer_cache.items()
+                     if expiry <= now]:
+            del customer_cache[pair]
+
+        expires_at = now + CUSTOMER_INFO_TTL
+        for row in rows:
+            customers[(row[0], row[1])] = row[2:]
+            customer_cache[(row[0], row[1])] = (expires_at, row[2:])
+
     customer_info_list = []
 
-    for action in actions:
-        try:
-            info = get_required_customer_info(action, latest_prices)
-            customer_info_list.append(info)
-        except ValueError as e:
+    for alert_type, user_commodity in actions:
+        user_id = user_commodity['user_id']
+        commodity_id = user_commodity['commodity_id']
+        row = customers.get((user_id, commodity_id))
+
+        if row is None:
             # Data not found - log as warning and continue
-            _, user_commodity = action
             logger.warning(
-                "Skipping alert for user_id=%s, commodity_id=%s - data not found: %s",
-                user_commodity['user_id'], user_commodity['commodity_id'], e
-            )
-            continue
-        except (DatabaseError, OperationalError) as e:
-            # Database error - log as error and continue
-            _, user_commodity = action
-            logger.error(
-                "Skipping alert for user_id=%s, commodity_id=%s - database error: %s",
-                user_commodity['user_id'], user_commodity['commodity_id'], e
+                "Skipping alert for user_id=%s, commodity_id=%s - data not found",
+                user_id, commodity_id
             )
             continue
 
+        customer_info_list.append({
+            "alert_type": alert_type,
+            "email": row[0],
+            "user_name": row[1],
+            "symbol": row[2],
+            "commodity_name": row[3],
+            "current_price": latest_prices[commodity_id],
+            "target_price": user_commodity['buy_price'] if alert_type == 'buy' else user_commodity['sell_price'],
+            "user_id": user_id,
+            "commodity_id": commodity_id
+        })
+
     return customer_info_list
 
 
-def update_alerted_at(user_commodity: dict):
-    """Update the alerted_at timestamp for the user commodity
+def update_alerted_at(sent_pairs: list[tuple]):
+    """Update the alerted_at timestamp for every alerted user commodity
+    with a single UPDATE and commit
 
     Args:
-        user_commodity: Dictionary containing user_id and commodity_id
+        sent_pairs: (user_id, commodity_id) tuples of the alerts sent
 
     Raises:
         DatabaseError: If database update fails
     """
-    user_id = user_commodity['user_id']
-    commodity_id = user_commodity['commodity_id']
+    if not sent_pairs:
+        return
 
-    conn = None
     try:
-        conn = get_conn()
-        cur = conn.cursor()
+        with get_conn() as conn:
+            cur = conn.cursor()
 
-        try:
-            cur.execute("""
-                UPDATE user_commodities
-                SET alerted_at = NOW()
-                WHERE user_id = %s AND commodity_id = %s
-            """, (user_id, commodity_id))
-            conn.commit()
-            logger.info("Updated alerted_at for user_id=%s, commodity_id=%s",
-                        user_id, commodity_id)
-        finally:
-            cur.close()
+            try:
+                execute_values(cur, """
+                    UPDATE user_commodities
+                    SET alerted_at = NOW()
+                    FROM (VALUES %s) AS v(uid, cid)
+                    WHERE user_commodities.user_id = v.uid
+                    AND user_commodities.commodity_id = v.cid
+                """, sent_pairs)
+                conn.commit()
+                logger.info("Updated alerted_at for %d user commodities",
+                            len(sent_pairs))
+            finally:
+                cur.close()
     except (DatabaseError, OperationalError) as e:
-        logger.error("Database error updating alerted_at for user_id=%s, commodity_id=%s: %s",
-                     user_id, commodity_id, e)
+        logger.error("Database error updating alerted_at for %d user commodities: %s",
+                     len(sent_pairs), e)
         raise
-    finally:
-        if conn is not None:
-            conn.close()
 
 
 def get_generated_report_list(all_customer_info: list[dict]) -> list[str]:
@@ -232,23 +315,43 @@ def get_generated_report_list(all_customer_info: list[dict]) -> list[str]:
     return [generate_alert_email(info) for info in all_customer_info]
 
 
+@lru_cache(maxsize=1)
+def get_logo_part() -> MIMEImage:
+    """Build the inline logo part once, so every email of every warm
+    invocation shares the same base64-encoded image"""
+    logo_part = MIMEImage(get_logo_bytes())
+    logo_part.add_header('Content-ID', '<logo>')
+    logo_part.add_header('Content-Disposition', 'inline', filename='logo.png')
+    return logo_part
+
+
+def to_raw_bytes(msg: MIMEMultipart) -> bytes:
+    """Serialize a MIME message straight to the CRLF bytes SES expects,
+    without building an intermediate str"""
+    buffer = io.BytesIO()
+    BytesGenerator(buffer, policy=SMTP).flatten(msg)
+    return buffer.getvalue()
+
+
 def send_emails(generated_reports: list[str], all_customer_info: list[dict]):
-    """Send alert emails using AWS SES with embedded logo"""
-    ses_client = boto3.client('ses', region_name='eu-west-2')
+    """Send alert emails using AWS SES with embedded logo
+
+    Emails are sent concurrently, up to SEND_WORKERS at a time, and paced
+    to stay under SES_MAX_SEND_RATE.
+    """
+    ses_client = get_ses_client()
+    limiter = SendPacer(SES_MAX_SEND_RATE)
     sender_email = ENV.get("SENDER_EMAIL")
-    logo_bytes = get_logo_bytes()
+    logo_part = get_logo_part()
+    verified_emails = set(ses_client.list_verified_email_addresses()[
+        'VerifiedEmailAddresses'])
 
-    for report, info in zip(generated_reports, all_customer_info):
+    def send_one(report: str, info: dict):
+        """Send one alert email, returning its (user_id, commodity_id)
+        pair once SES accepts it, or None if it was not sent"""
         logger.info("Processing email for %s", info['email'])
 
         try:
-            verified_emails = ses_client.list_verified_email_addresses()[
-                'VerifiedEmailAddresses']
-            if info['email'] not in verified_emails:
-                logger.warning(
-                    "Email %s is not verified in SES. Skipping.", info['email'])
-                continue
-
             # Create MIME message with embedded image
             msg = MIMEMultipart('related')
             msg['Subject'] = f"Price Alert for {info['commodity_name']}"
@@ -260,50 +363,64 @@ def send_emails(generated_reports: list[str], all_customer_info: list[dict]):
             msg.attach(html_part)
 
             # Attach logo image
-            img = MIMEImage(logo_bytes)
-            img.add_header('Content-ID', '<logo>')
-            img.add_header('Content-Disposition',
-                           'inline', filename='logo.png')
-            msg.attach(img)
+            msg.attach(logo_part)
 
+            limiter.acquire()
             response = ses_client.send_raw_email(
                 Source=sender_email,
                 Destinations=[info['email']],
-                RawMessage={'Data': msg.as_string()}
+                RawMessage={'Data': to_raw_bytes(msg)}
             )
-            logger.info("Email sent to %s: %s",
-                        info['email'], response['MessageId'])
-
-            # Update alerted_at timestamp
-            try:
-                update_alerted_at(info)
-            except (DatabaseError, OperationalError) as e:
-                logger.error("Failed to update alerted_at after sending email to %s: %s",
-                             info['email'], e)
-                # Continue processing other emails even if update fails
+            message_id = response.get('MessageId')
+            if not message_id:
+                logger.error("SES returned no MessageId for %s", info['email'])
+                return None
+            logger.info("Email sent to %s: %s", info['email'], message_id)
+            return (info['user_id'], info['commodity_id'])
 
         except Exception as e:
             logger.error("Failed to send email to %s: %s", info['email'], e)
             # Continue processing other emails even if one fails
+            return None
+
+    to_send = []
+    for report, info in zip(generated_reports, all_customer_info):
+        if info['email'] not in verified_emails:
+            logger.warning(
+                "Email %s is not verified in SES. Skipping.", info['email'])
+            continue
+        to_send.append((report, info))
+
+    sent_pairs = []
+    if to_send:
+        workers = min(SEND_WORKERS, len(to_send))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lambda job: send_one(*job), to_send)
+            sent_pairs = [pair for pair in results if pair is not None]
+
+    # Update alerted_at timestamps for every email sent
+    try:
+        update_alerted_at(sent_pairs)
+    except (DatabaseError, OperationalError) as e:
+        logger.error("Failed to update alerted_at after sending %d emails: %s",
+                     len(sent_pairs), e)
 
 
 def handler(event, context):
     """AWS Lambda handler function for processing price alerts"""
-    load_dotenv()
-
     try:
         logger.info("Starting price alert processing")
 
-        user_commodities = get_user_commodities()
-        if not user_commodities:
-            logger.info("No user commodities found for alert checking")
+        latest_prices = get_latest_prices(event)
+        user_commodities = get_user_commodities(latest_prices)
+        if user_commodities.empty:
+            logger.info("No user commodities crossed their alert prices")
             return {"statusCode": 200, "message": "No alerts to process"}
 
-        latest_prices = get_latest_prices(event)
         logger.info("Processing %d user commodities against %d price updates",
                     len(user_commodities), len(latest_prices))
 
-        all_actions = check_all_alerts(user_commodities, latest_prices)
+        all_actions = check_all_alerts(user_commodities)
         logger.info("Found %d alerts to send", len(all_actions))
 
         if not all_actions:
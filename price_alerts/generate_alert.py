@@ -1,23 +1,26 @@
 """Function to generate price alert html for commodities."""
 import os
+from functools import lru_cache
+from string import Template
 
 
+@lru_cache(maxsize=1)
 def get_logo_bytes() -> bytes:
-    """Load logo and return as bytes."""
+    """Load logo and return as bytes, reading the file once per process."""
     logo_path = os.path.join(os.path.dirname(__file__), "Logo.png")
     with open(logo_path, "rb") as f:
         return f.read()
 
 
-def generate_alert_email(alert: dict) -> str:
-    """Generate HTML email for price alert"""
-
-    alert_color = "#22c55e" if alert['alert_type'] == "buy" else "#ef4444"
-    alert_label = "BUY" if alert['alert_type'] == "buy" else "SELL"
-    accent_color = "#03c1ff" if alert['alert_type'] == "buy" else "#e6530c"
-    formatted_name = alert['user_name'].split('_')[0].capitalize()
+# (alert colour, label, accent colour) for each alert type
+_STYLE = {
+    "buy": ("#22c55e", "BUY", "#03c1ff"),
+    "sell": ("#ef4444", "SELL", "#e6530c"),
+}
 
-    html = f"""<!DOCTYPE html>
+# the alert email skeleton, parsed once at import; `$$` is a literal
+# dollar sign and the ${...} placeholders are filled per alert
+_TEMPLATE = Template("""<!DOCTYPE html>
 <!DOCTYPE html>
 <html>
 <head>
@@ -40,8 +43,8 @@ def generate_alert_email(alert: dict) -> str:
                     <!-- Alert Badge with Icon -->
                     <tr>
                         <td style="padding: 40px 30px 20px; text-align: center; background: linear-gradient(180deg, #f8fafc 0%, #ffffff 100%);">
-                            <div style="display: inline-block; background-color: {alert_color}; color: white; padding: 12px 28px; border-radius: 30px; font-weight: bold; font-size: 16px; box-shadow: 0 4px 12px rgba(0,0,0,0.15); letter-spacing: 1px;">
-                                {alert_label} ALERT TRIGGERED
+                            <div style="display: inline-block; background-color: ${alert_color}; color: white; padding: 12px 28px; border-radius: 30px; font-weight: bold; font-size: 16px; box-shadow: 0 4px 12px rgba(0,0,0,0.15); letter-spacing: 1px;">
+                                ${alert_label} ALERT TRIGGERED
                             </div>
                         </td>
                     </tr>
@@ -49,11 +52,11 @@ def generate_alert_email(alert: dict) -> str:
                     <!-- Commodity Info with Accent Border -->
                     <tr>
                         <td style="padding: 20px 30px;">
-                            <div style="background: linear-gradient(135deg, {accent_color}15 0%, {accent_color}05 100%); border-left: 4px solid {accent_color}; border-radius: 8px; padding: 20px; text-align: center;">
-                                <h2 style="color: #1e293b; margin: 0 0 8px 0; font-size: 28px; font-weight: 700;">{alert['commodity_name']}</h2>
+                            <div style="background: linear-gradient(135deg, ${accent_color}15 0%, ${accent_color}05 100%); border-left: 4px solid ${accent_color}; border-radius: 8px; padding: 20px; text-align: center;">
+                                <h2 style="color: #1e293b; margin: 0 0 8px 0; font-size: 28px; font-weight: 700;">${commodity_name}</h2>
                                 <p style="color: #64748b; margin: 0; font-size: 16px; font-weight: 600;">
-                                    <span style="background-color: {accent_color}20; color: {accent_color}; padding: 4px 12px; border-radius: 12px;">
-                                        {alert['symbol']}
+                                    <span style="background-color: ${accent_color}20; color: ${accent_color}; padding: 4px 12px; border-radius: 12px;">
+                                        ${symbol}
                                     </span>
                                 </p>
                             </div>
@@ -63,7 +66,7 @@ def generate_alert_email(alert: dict) -> str:
                     <!-- Greeting -->
                     <tr>
                         <td style="padding: 20px 30px 10px;">
-                            <p style="font-size: 18px; color: #333; margin: 0; font-weight: 600;">Hi {formatted_name} 👋</p>
+                            <p style="font-size: 18px; color: #333; margin: 0; font-weight: 600;">Hi ${formatted_name} 👋</p>
                         </td>
                     </tr>
                     
@@ -82,16 +85,16 @@ def generate_alert_email(alert: dict) -> str:
                             <table width="100%" cellpadding="0" cellspacing="0">
                                 <tr>
                                     <td width="48%" style="vertical-align: top;">
-                                        <div style="background: linear-gradient(135deg, {accent_color}10 0%, {accent_color}05 100%); border-radius: 12px; padding: 20px; text-align: center; border: 2px solid {accent_color}30;">
+                                        <div style="background: linear-gradient(135deg, ${accent_color}10 0%, ${accent_color}05 100%); border-radius: 12px; padding: 20px; text-align: center; border: 2px solid ${accent_color}30;">
                                             <p style="color: #64748b; font-size: 13px; margin: 0 0 8px 0; text-transform: uppercase; letter-spacing: 0.5px; font-weight: 600;">Current Price</p>
-                                            <p style="color: {accent_color}; font-size: 32px; font-weight: 700; margin: 0; line-height: 1;">${alert['current_price']:.2f}</p>
+                                            <p style="color: ${accent_color}; font-size: 32px; font-weight: 700; margin: 0; line-height: 1;">$$${current_price}</p>
                                         </div>
                                     </td>
                                     <td width="4%"></td>
                                     <td width="48%" style="vertical-align: top;">
                                         <div style="background-color: #f1f5f9; border-radius: 12px; padding: 20px; text-align: center; border: 2px solid #e2e8f0;">
                                             <p style="color: #64748b; font-size: 13px; margin: 0 0 8px 0; text-transform: uppercase; letter-spacing: 0.5px; font-weight: 600;">Target Price</p>
-                                            <p style="color: #334155; font-size: 32px; font-weight: 700; margin: 0; line-height: 1;">${alert['target_price']:.2f}</p>
+                                            <p style="color: #334155; font-size: 32px; font-weight: 700; margin: 0; line-height: 1;">$$${target_price}</p>
                                         </div>
                                     </td>
                                 </tr>
@@ -126,8 +129,26 @@ def generate_alert_email(alert: dict) -> str:
     </table>
 </body>
 </html>
-"""
-    return html
+""")
+
+
+def generate_alert_email(alert: dict) -> str:
+    """Generate HTML email for price alert"""
+
+    alert_color, alert_label, accent_color = _STYLE.get(
+        alert['alert_type'], _STYLE['sell'])
+    formatted_name = alert['user_name'].partition('_')[0].capitalize()
+
+    return _TEMPLATE.substitute(
+        alert_color=alert_color,
+        alert_label=alert_label,
+        accent_color=accent_color,
+        formatted_name=formatted_name,
+        commodity_name=alert['commodity_name'],
+        symbol=alert['symbol'],
+        current_price=f"{alert['current_price']:.2f}",
+        target_price=f"{alert['target_price']:.2f}",
+    )
 
 
 def save_test_email(alert: dict, filename: str = "test_email.html"):
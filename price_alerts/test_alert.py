@@ -1,9 +1,36 @@
 """Tests for alert.py functions"""
-from alert import check_one_alert, check_all_alerts, get_latest_prices
+import ast
+import inspect
+from email.mime.image import MIMEImage
+from unittest.mock import patch, MagicMock
+
+import pandas as pd
+import pytest
+
+import alert
+
+from alert import (check_all_alerts, get_latest_prices,
+                   get_user_commodities, get_all_required_customer_info,
+                   update_alerted_at, send_emails, SendPacer,
+                   get_logo_part, get_ses_client)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches(monkeypatch):
+    """Rebuild the cached logo part, SES client and customer info so each
+    test sees its own patches, and give the emails a sender"""
+    monkeypatch.setenv("SENDER_EMAIL", "alerts@example.com")
+    get_logo_part.cache_clear()
+    get_ses_client.cache_clear()
+    alert.customer_cache.clear()
+    yield
+    get_logo_part.cache_clear()
+    get_ses_client.cache_clear()
+    alert.customer_cache.clear()
 
 
 def test_get_latest_prices():
-    """Test converting event body to dictionary"""
+    """Test converting event body to a commodity_id -> price dictionary"""
     event = {
         "statusCode": 200,
         "body": [
@@ -14,179 +41,345 @@ def test_get_latest_prices():
     result = get_latest_prices(event)
 
     assert isinstance(result, dict)
-    assert result[1]['price'] == 100.5
-    assert result[2]['price'] == 200.75
+    assert result == {1: 100.5, 2: 200.75}
 
 
-def test_check_one_alert_buy_triggered():
-    """Test buy alert is triggered when price is below buy_price"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": 100.0,
-        "sell_price": None
-    }
-    commodity_price = {"commodity_id": 1, "price": 95.0}
+def test_check_all_alerts():
+    """Test each alerting row is paired with the alert type from the query"""
+    user_commodities = pd.DataFrame([
+        {"user_id": 10, "commodity_id": 1, "buy_price": 100.0,
+         "sell_price": None, "alert_type": "buy"},
+        {"user_id": 11, "commodity_id": 2, "buy_price": None,
+         "sell_price": 200.0, "alert_type": "sell"},
+    ])
 
-    result = check_one_alert(user_commodity, commodity_price)
+    result = check_all_alerts(user_commodities)
 
-    assert result is not None
-    assert result[0] == 'buy'
-    assert result[1] == user_commodity
+    assert [alert_type for alert_type, _ in result] == ['buy', 'sell']
+    assert [(row["user_id"], row["buy_price"]) for _, row in result[:1]] == [(10, 100.0)]
+    assert "alert_type" not in result[0][1]
 
 
-def test_check_one_alert_sell_triggered():
-    """Test sell alert is triggered when price is above sell_price"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": None,
-        "sell_price": 100.0
-    }
-    commodity_price = {"commodity_id": 1, "price": 105.0}
+def test_check_all_alerts_empty_user_commodities():
+    """Test checking alerts with empty user commodities list"""
+    result = check_all_alerts(pd.DataFrame())
+
+    assert result == []
 
-    result = check_one_alert(user_commodity, commodity_price)
 
-    assert result is not None
-    assert result[0] == 'sell'
-    assert result[1] == user_commodity
+def test_get_latest_prices_empty_body():
+    """Test getting latest prices with empty body"""
+    event = {"statusCode": 200, "body": []}
+    result = get_latest_prices(event)
+
+    assert isinstance(result, dict)
+    assert len(result) == 0
 
 
-def test_check_one_alert_not_triggered():
-    """Test alert is not triggered when conditions are not met"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": 100.0,
-        "sell_price": 200.0
+@patch("alert.get_conn")
+def test_get_user_commodities_reads_copy_output(mock_get_conn):
+    """Test alerting user commodities are parsed from a COPY into a DataFrame"""
+    mock_cur = MagicMock()
+    mock_cur.copy_expert.side_effect = lambda query, buffer: buffer.write(
+        "user_id,commodity_id,buy_price,sell_price,alert_type\n"
+        "10,1,100.0,,buy\n"
+        "11,2,,200.0,sell\n"
+    )
+    mock_cur.mogrify.side_effect = lambda query, args: query.encode()
+    mock_get_conn.return_value.__enter__.return_value.cursor.return_value = mock_cur
+
+    result = get_user_commodities({1: 95.0, 2: 210.0})
+
+    assert "COPY" in mock_cur.copy_expert.call_args[0][0]
+    assert "SELECT *" not in mock_cur.copy_expert.call_args[0][0]
+    assert ("CASE WHEN lp.price <= uc.buy_price\n"
+            in mock_cur.copy_expert.call_args[0][0])
+    assert mock_cur.mogrify.call_args[0][1] == ([1, 2], [95.0, 210.0])
+    assert isinstance(result, pd.DataFrame)
+    assert list(result["user_id"]) == [10, 11]
+    assert result["buy_price"].dtype == "float64"
+    assert result["sell_price"].isna().tolist() == [True, False]
+    assert list(result["alert_type"]) == ['buy', 'sell']
+    mock_cur.close.assert_called_once()
+    mock_get_conn.return_value.__exit__.assert_called_once()
+
+
+def test_check_all_alerts_keeps_row_order():
+    """Test alerts come back in user commodity order with their rows"""
+    user_commodities = pd.DataFrame([
+        {"user_id": 10, "commodity_id": 2, "buy_price": None,
+         "sell_price": 200.0, "alert_type": "sell"},
+        {"user_id": 11, "commodity_id": 1, "buy_price": 100.0,
+         "sell_price": None, "alert_type": "buy"},
+    ])
+
+    result = check_all_alerts(user_commodities)
+
+    assert [alert_type for alert_type, _ in result] == ['sell', 'buy']
+    assert [row["user_id"] for _, row in result] == [10, 11]
+
+
+@patch("alert.execute_values")
+@patch("alert.get_conn")
+def test_get_all_required_customer_info_uses_one_query(mock_get_conn, mock_execute_values):
+    """Test customer info for every alert comes from a single query"""
+    mock_execute_values.return_value = [
+        (10, 1, "a@example.com", "Ann", "GCUSD", "Gold"),
+        (11, 2, "b@example.com", "Bob", "SIUSD", "Silver"),
+    ]
+    actions = [
+        ('buy', {"user_id": 10, "commodity_id": 1, "buy_price": 100.0, "sell_price": None}),
+        ('sell', {"user_id": 11, "commodity_id": 2, "buy_price": None, "sell_price": 20.0}),
+    ]
+    latest_prices = {
+        1: 95.0,
+        2: 25.0,
     }
-    commodity_price = {"commodity_id": 1, "price": 150.0}
 
-    result = check_one_alert(user_commodity, commodity_price)
+    result = get_all_required_customer_info(actions, latest_prices)
+
+    mock_execute_values.assert_called_once()
+    assert "IN (VALUES %s)" in mock_execute_values.call_args[0][1]
+    assert sorted(mock_execute_values.call_args[0][2]) == [(10, 1), (11, 2)]
+    mock_get_conn.assert_called_once()
+    assert [info["email"] for info in result] == ["a@example.com", "b@example.com"]
+    assert result[0]["target_price"] == 100.0
+    assert result[1]["current_price"] == 25.0
+
+
+@patch("alert.execute_values")
+@patch("alert.get_conn")
+def test_get_all_required_customer_info_skips_missing_rows(mock_get_conn, mock_execute_values):
+    """Test alerts without matching customer info are skipped"""
+    mock_execute_values.return_value = [(10, 1, "a@example.com", "Ann", "GCUSD", "Gold")]
+    actions = [
+        ('buy', {"user_id": 10, "commodity_id": 1, "buy_price": 100.0, "sell_price": None}),
+        ('buy', {"user_id": 99, "commodity_id": 1, "buy_price": 100.0, "sell_price": None}),
+    ]
+    latest_prices = {1: 95.0}
 
-    assert result is None
+    result = get_all_required_customer_info(actions, latest_prices)
 
+    assert len(result) == 1
+    assert result[0]["user_id"] == 10
 
-def test_check_one_alert_none_commodity_price():
-    """Test alert returns None when commodity_price is None"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": 100.0,
-        "sell_price": None
-    }
 
-    result = check_one_alert(user_commodity, None)
+@patch("alert.execute_values")
+@patch("alert.get_conn")
+def test_update_alerted_at_batches_into_one_update(mock_get_conn, mock_execute_values):
+    """Test every sent alert is marked with one UPDATE and one commit"""
+    update_alerted_at([(10, 1), (11, 2)])
 
-    assert result is None
+    mock_execute_values.assert_called_once()
+    assert "FROM (VALUES %s)" in mock_execute_values.call_args[0][1]
+    assert mock_execute_values.call_args[0][2] == [(10, 1), (11, 2)]
+    mock_get_conn.return_value.__enter__.return_value.commit.assert_called_once()
 
 
-def test_check_all_alerts():
-    """Test checking multiple alerts"""
-    user_commodities = [
-        {"commodity_id": 1, "buy_price": 100.0, "sell_price": None},
-        {"commodity_id": 2, "buy_price": None, "sell_price": 200.0},
-        {"commodity_id": 3, "buy_price": 50.0, "sell_price": None}
+@patch("alert.get_conn")
+def test_update_alerted_at_skips_database_when_nothing_sent(mock_get_conn):
+    """Test no connection is opened when no emails were sent"""
+    update_alerted_at([])
+
+    mock_get_conn.assert_not_called()
+
+
+@patch("alert.update_alerted_at")
+@patch("alert.get_logo_bytes", return_value=b"\x89PNG\r\n\x1a\n")
+@patch("alert.boto3.client")
+def test_send_emails_lists_verified_addresses_once(mock_client, _, mock_update):
+    """Test SES verified addresses are fetched once and unverified skipped"""
+    ses = mock_client.return_value
+    ses.list_verified_email_addresses.return_value = {
+        "VerifiedEmailAddresses": ["a@example.com", "b@example.com"]}
+    ses.send_raw_email.return_value = {"MessageId": "id"}
+    infos = [
+        {"email": email, "commodity_name": "Gold", "user_id": uid, "commodity_id": 1}
+        for uid, email in enumerate(["a@example.com", "b@example.com", "c@example.com"])
     ]
 
-    latest_prices = {
-        1: {"commodity_id": 1, "price": 95.0},   # Buy alert triggered
-        2: {"commodity_id": 2, "price": 205.0},  # Sell alert triggered
-        3: {"commodity_id": 3, "price": 60.0}    # No alert
-    }
+    send_emails(["<p>a</p>", "<p>b</p>", "<p>c</p>"], infos)
+
+    ses.list_verified_email_addresses.assert_called_once()
+    assert ses.send_raw_email.call_count == 2
+    mock_update.assert_called_once_with([(0, 1), (1, 1)])
+
+
+@patch("alert.update_alerted_at")
+@patch("alert.get_logo_bytes", return_value=b"\x89PNG\r\n\x1a\n")
+@patch("alert.boto3.client")
+def test_send_emails_only_marks_successful_sends(mock_client, _, mock_update):
+    """Test a failed SES send is not marked as alerted"""
+    ses = mock_client.return_value
+    ses.list_verified_email_addresses.return_value = {
+        "VerifiedEmailAddresses": ["a@example.com", "b@example.com"]}
+
+    def send_raw_email(**kwargs):
+        if kwargs["Destinations"] == ["a@example.com"]:
+            raise RuntimeError("throttled")
+        return {"MessageId": "id"}
+    ses.send_raw_email.side_effect = send_raw_email
+    infos = [
+        {"email": email, "commodity_name": "Gold", "user_id": uid, "commodity_id": 1}
+        for uid, email in enumerate(["a@example.com", "b@example.com"])
+    ]
 
-    result = check_all_alerts(user_commodities, latest_prices)
+    send_emails(["<p>a</p>", "<p>b</p>"], infos)
+
+    assert ses.send_raw_email.call_count == 2
+    mock_update.assert_called_once_with([(1, 1)])
+
+
+@patch("alert.update_alerted_at")
+@patch("alert.get_logo_bytes", return_value=b"\x89PNG\r\n\x1a\n")
+@patch("alert.MIMEImage", wraps=MIMEImage)
+@patch("alert.boto3.client")
+def test_send_emails_encodes_logo_once(mock_client, mock_image, _, __):
+    """Test the logo part is built once and embedded in every email"""
+    ses = mock_client.return_value
+    ses.list_verified_email_addresses.return_value = {
+        "VerifiedEmailAddresses": ["a@example.com", "b@example.com"]}
+    ses.send_raw_email.return_value = {"MessageId": "id"}
+    infos = [
+        {"email": email, "commodity_name": "Gold", "user_id": uid, "commodity_id": 1}
+        for uid, email in enumerate(["a@example.com", "b@example.com"])
+    ]
 
-    assert len(result) == 2
-    assert result[0][0] == 'buy'
-    assert result[1][0] == 'sell'
+    send_emails(["<p>a</p>", "<p>b</p>"], infos)
 
+    mock_image.assert_called_once()
+    for call in ses.send_raw_email.call_args_list:
+        assert b"Content-ID: <logo>\r\n" in call.kwargs["RawMessage"]["Data"]
 
-def test_check_one_alert_buy_at_exact_price():
-    """Test buy alert is triggered when price equals buy_price"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": 100.0,
-        "sell_price": None
-    }
-    commodity_price = {"commodity_id": 1, "price": 100.0}
 
-    result = check_one_alert(user_commodity, commodity_price)
+@patch("alert.get_logo_bytes", return_value=b"\x89PNG\r\n\x1a\n")
+def test_get_logo_part_is_built_once(mock_logo):
+    """Test the logo part is reused across calls"""
+    assert get_logo_part() is get_logo_part()
+    mock_logo.assert_called_once()
 
-    assert result is not None
-    assert result[0] == 'buy'
 
+@patch("alert.update_alerted_at")
+@patch("alert.get_logo_bytes", return_value=b"\x89PNG\r\n\x1a\n")
+@patch("alert.boto3.client")
+def test_send_emails_requires_message_id(mock_client, _, mock_update):
+    """Test a send without a MessageId from SES is not marked as alerted"""
+    ses = mock_client.return_value
+    ses.list_verified_email_addresses.return_value = {
+        "VerifiedEmailAddresses": ["a@example.com"]}
+    ses.send_raw_email.return_value = {}
+    infos = [{"email": "a@example.com", "commodity_name": "Gold",
+              "user_id": 0, "commodity_id": 1}]
 
-def test_check_one_alert_sell_at_exact_price():
-    """Test sell alert is triggered when price equals sell_price"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": None,
-        "sell_price": 100.0
-    }
-    commodity_price = {"commodity_id": 1, "price": 100.0}
+    send_emails(["<p>a</p>"], infos)
 
-    result = check_one_alert(user_commodity, commodity_price)
+    mock_update.assert_called_once_with([])
 
-    assert result is not None
-    assert result[0] == 'sell'
 
+@patch("alert.boto3.client")
+def test_get_ses_client_is_created_once(mock_client):
+    """Test warm invocations reuse the same SES client"""
+    assert get_ses_client() is get_ses_client()
+    mock_client.assert_called_once()
 
-def test_check_one_alert_both_prices_set_buy_triggered():
-    """Test buy alert when both buy and sell prices are set"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": 100.0,
-        "sell_price": 200.0
-    }
-    commodity_price = {"commodity_id": 1, "price": 95.0}
 
-    result = check_one_alert(user_commodity, commodity_price)
+@patch("alert.execute_values")
+@patch("alert.get_conn")
+def test_get_all_required_customer_info_reuses_cached_rows(mock_get_conn, mock_execute_values):
+    """Test customer info fetched once is served from memory next time"""
+    mock_execute_values.return_value = [(10, 1, "a@example.com", "Ann", "GCUSD", "Gold")]
+    actions = [
+        ('buy', {"user_id": 10, "commodity_id": 1, "buy_price": 100.0, "sell_price": None}),
+    ]
 
-    assert result is not None
-    assert result[0] == 'buy'
+    get_all_required_customer_info(actions, {1: 95.0})
+    result = get_all_required_customer_info(actions, {1: 90.0})
 
+    mock_execute_values.assert_called_once()
+    mock_get_conn.assert_called_once()
+    assert result[0]["email"] == "a@example.com"
+    assert result[0]["current_price"] == 90.0
 
-def test_check_one_alert_both_prices_set_sell_triggered():
-    """Test sell alert when both buy and sell prices are set"""
-    user_commodity = {
-        "commodity_id": 1,
-        "buy_price": 100.0,
-        "sell_price": 200.0
-    }
-    commodity_price = {"commodity_id": 1, "price": 205.0}
 
-    result = check_one_alert(user_commodity, commodity_price)
+@patch("alert.time.monotonic")
+@patch("alert.execute_values")
+@patch("alert.get_conn")
+def test_get_all_required_customer_info_evicts_expired_rows(mock_get_conn, mock_execute_values,
+                                                            mock_monotonic):
+    """Test expired customer info is dropped when new rows are cached"""
+    mock_monotonic.return_value = 0.0
+    mock_execute_values.return_value = [(10, 1, "a@example.com", "Ann", "GCUSD", "Gold")]
+    get_all_required_customer_info(
+        [('buy', {"user_id": 10, "commodity_id": 1, "buy_price": 100.0, "sell_price": None})],
+        {1: 90.0})
 
-    assert result is not None
-    assert result[0] == 'sell'
+    mock_monotonic.return_value = alert.CUSTOMER_INFO_TTL + 1.0
+    mock_execute_values.return_value = [(11, 2, "b@example.com", "Bob", "SIUSD", "Silver")]
+    get_all_required_customer_info(
+        [('sell', {"user_id": 11, "commodity_id": 2, "buy_price": None, "sell_price": 20.0})],
+        {2: 25.0})
 
+    assert list(alert.customer_cache) == [(11, 2)]
 
-def test_check_all_alerts_empty_user_commodities():
-    """Test checking alerts with empty user commodities list"""
-    result = check_all_alerts([], {})
 
-    assert result == []
+@patch("alert.time.sleep")
+@patch("alert.time.monotonic", side_effect=[100.0, 100.0, 105.0])
+def test_send_pacer_skips_sleep_once_slot_has_passed(_, mock_sleep):
+    """Test a send arriving after its slot goes straight through"""
+    pacer = SendPacer(rate=2)
 
+    for _ in range(2):
+        pacer.acquire()
 
-def test_check_all_alerts_missing_commodity_prices():
-    """Test checking alerts when some commodity prices are missing"""
-    user_commodities = [
-        {"commodity_id": 1, "buy_price": 100.0, "sell_price": None},
-        {"commodity_id": 2, "buy_price": None, "sell_price": 200.0},
-    ]
+    mock_sleep.assert_called_once_with(0.5)
 
-    latest_prices = {
-        1: {"commodity_id": 1, "price": 95.0},  # Buy alert triggered
-        # Commodity 2 missing - should return None for that check
-    }
 
-    result = check_all_alerts(user_commodities, latest_prices)
+@patch("alert.time.sleep")
+@patch("alert.time.monotonic", return_value=0.0)
+def test_send_pacer_does_not_bank_credit_during_a_stall(mock_monotonic, mock_sleep):
+    """Test a long pause lets one send through, not every missed slot"""
+    pacer = SendPacer(rate=14)
 
-    assert len(result) == 1
-    assert result[0][0] == 'buy'
+    mock_monotonic.return_value = 10.0
+    for _ in range(14):
+        pacer.acquire()
 
+    waits = [call.args[0] for call in mock_sleep.call_args_list]
+    assert waits == pytest.approx([n / 14 for n in range(1, 14)])
 
-def test_get_latest_prices_empty_body():
-    """Test getting latest prices with empty body"""
-    event = {"statusCode": 200, "body": []}
-    result = get_latest_prices(event)
 
-    assert isinstance(result, dict)
-    assert len(result) == 0
+def test_handler_single_definition():
+    """Test the module defines handler exactly once"""
+    tree = ast.parse(inspect.getsource(alert))
+    handlers = [node for node in tree.body
+                if isinstance(node, ast.FunctionDef) and node.name == "handler"]
+
+    assert len(handlers) == 1
+
+
+@patch("alert.time.sleep")
+@patch("alert.time.monotonic", return_value=0.0)
+def test_send_pacer_keeps_first_second_within_rate(_, mock_sleep):
+    """Test sends are spaced 1/rate apart from the first one"""
+    pacer = SendPacer(rate=14)
+
+    for _ in range(15):
+        pacer.acquire()
+
+    waits = [call.args[0] for call in mock_sleep.call_args_list]
+    assert waits == pytest.approx([n / 14 for n in range(1, 16)])
+    assert sum(wait <= 1.0 for wait in waits) == 14
+
+
+@patch("alert.update_alerted_at")
+@patch("alert.get_logo_bytes", return_value=b"\x89PNG\r\n\x1a\n")
+@patch("alert.SendPacer")
+@patch("alert.boto3.client")
+def test_send_emails_paces_at_the_ses_rate(mock_client, mock_pacer, _, __):
+    """Test SES sends are paced at the configured SES maximum send rate"""
+    mock_client.return_value.list_verified_email_addresses.return_value = {
+        "VerifiedEmailAddresses": []}
+
+    send_emails([], [])
+
+    mock_pacer.assert_called_once_with(alert.SES_MAX_SEND_RATE)
@@ -1,83 +1,130 @@
 """Tests for generate_alert.py functions"""
-import pytest
+import hashlib
+import json
 import os
+import re
+
+import pytest
+
 from generate_alert import generate_alert_email, get_logo_bytes
 
 
-def test_generate_alert_email_buy():
-    """Test generating a buy alert email"""
-    alert = {
+# the document skeleton, in order
+_HTML_STRUCTURE = re.compile(
+    r"<!DOCTYPE html>.*?<html>.*?<body[^>]*>.*?</body>.*?</html>", re.S)
+
+_BASE_ALERT = {
+    'alert_type': 'buy',
+    'user_name': 'test_user',
+    'commodity_name': 'Test',
+    'symbol': 'TST',
+    'current_price': 100.0,
+    'target_price': 110.0
+}
+
+
+def _alert(**overrides) -> dict:
+    """Builds a buy alert for TST, with any fields overridden."""
+    return {**_BASE_ALERT, **overrides}
+
+
+def _assert_all_in(html: str, needles: list[str]):
+    """Asserts every needle appears in html, reporting all that are missing."""
+    missing = [needle for needle in needles if needle not in html]
+    assert not missing, f"missing from email: {missing}"
+
+
+# canonical alerts whose rendered emails are pinned in testdata/golden.json
+CASES = {
+    'buy': {
         'alert_type': 'buy',
         'user_name': 'john_doe',
         'commodity_name': 'Gold Futures',
         'symbol': 'GCUSD',
         'current_price': 2000.50,
         'target_price': 2100.00
-    }
-
-    result = generate_alert_email(alert)
-
-    assert isinstance(result, str)
-    assert 'BUY ALERT TRIGGERED' in result
-    assert 'Gold Futures' in result
-    assert 'GCUSD' in result
-    assert 'John' in result  # First name capitalized
-    assert '$2000.50' in result
-    assert '$2100.00' in result
-    assert '#22c55e' in result  # Green color for buy
-
-
-def test_generate_alert_email_sell():
-    """Test generating a sell alert email"""
-    alert = {
+    },
+    'sell': {
         'alert_type': 'sell',
         'user_name': 'jane_smith',
         'commodity_name': 'Silver Futures',
         'symbol': 'SIUSD',
         'current_price': 25.75,
         'target_price': 24.00
-    }
-
-    result = generate_alert_email(alert)
-
-    assert isinstance(result, str)
-    assert 'SELL ALERT TRIGGERED' in result
-    assert 'Silver Futures' in result
-    assert 'SIUSD' in result
-    assert 'Jane' in result  # First name capitalized
-    assert '$25.75' in result
-    assert '$24.00' in result
-    assert '#ef4444' in result  # Red color for sell
-
-
-def test_generate_alert_email_has_logo():
+    },
+}
+
+with open(os.path.join(os.path.dirname(__file__), "testdata", "golden.json"),
+          encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+# set FAST_TESTS to skip the checks the golden digests already cover
+covered_by_golden = pytest.mark.skipif(
+    bool(os.getenv("FAST_TESTS")), reason="covered by golden digests")
+
+
+@pytest.fixture(scope="module")
+def buy_email():
+    """A buy alert email, rendered once per module."""
+    return generate_alert_email(CASES['buy'])
+
+
+@pytest.fixture(scope="module")
+def sell_email():
+    """A sell alert email, rendered once per module."""
+    return generate_alert_email(CASES['sell'])
+
+
+@pytest.mark.parametrize("case", ["buy", "sell"])
+def test_generate_alert_email_golden(case, request):
+    """Test the canonical emails render exactly as pinned"""
+    email = request.getfixturevalue(f"{case}_email")
+
+    digest = hashlib.blake2b(email.encode(), digest_size=16).hexdigest()
+
+    assert digest == GOLDEN[case]
+
+
+@covered_by_golden
+@pytest.mark.parametrize("email_fixture,needles", [
+    ("buy_email", [
+        'BUY ALERT TRIGGERED',
+        'Gold Futures',
+        'GCUSD',
+        'John',  # First name capitalized
+        '$2000.50',
+        '$2100.00',
+        '#22c55e',  # Green color for buy
+        '#03c1ff',  # Blue accent for buy
+    ]),
+    ("sell_email", [
+        'SELL ALERT TRIGGERED',
+        'Silver Futures',
+        'SIUSD',
+        'Jane',  # First name capitalized
+        '$25.75',
+        '$24.00',
+        '#ef4444',  # Red color for sell
+        '#e6530c',  # Orange accent for sell
+    ]),
+], ids=["buy", "sell"])
+def test_generate_alert_email_variants(email_fixture, needles, request):
+    """Test each alert type renders its label, details and colours"""
+    email = request.getfixturevalue(email_fixture)
+
+    assert isinstance(email, str)
+    _assert_all_in(email, needles)
+
+
+@covered_by_golden
+def test_generate_alert_email_has_logo(buy_email):
     """Test that email includes logo reference"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'test_user',
-        'commodity_name': 'Test Commodity',
-        'symbol': 'TEST',
-        'current_price': 100.0,
-        'target_price': 110.0
-    }
-
-    result = generate_alert_email(alert)
-
-    assert 'cid:logo' in result
+    assert 'cid:logo' in buy_email
 
 
 def test_generate_alert_email_first_name_only():
     """Test that only first name is shown"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'alice_wonderland',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.0,
-        'target_price': 110.0
-    }
-
-    result = generate_alert_email(alert)
+    result = generate_alert_email(_alert(user_name='alice_wonderland'))
 
     assert 'Alice' in result
     assert 'Wonderland' not in result
@@ -91,70 +138,30 @@ def test_get_logo_bytes():
     assert len(result) > 0
 
 
-def test_generate_alert_email_buy_uses_blue_accent():
-    """Test that buy alert uses blue accent color"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'test_user',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.0,
-        'target_price': 110.0
-    }
-
-    result = generate_alert_email(alert)
-
-    assert '#03c1ff' in result  # Blue accent for buy
-
-
-def test_generate_alert_email_sell_uses_orange_accent():
-    """Test that sell alert uses orange accent color"""
-    alert = {
-        'alert_type': 'sell',
-        'user_name': 'test_user',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.0,
-        'target_price': 90.0
-    }
-
-    result = generate_alert_email(alert)
-
-    assert '#e6530c' in result  # Orange accent for sell
+def test_get_logo_bytes_reads_file_once():
+    """Test the logo is read from disk once and then served from memory"""
+    assert get_logo_bytes() is get_logo_bytes()
 
 
-def test_generate_alert_email_contains_html_structure():
+@covered_by_golden
+def test_generate_alert_email_contains_html_structure(buy_email):
     """Test that email contains proper HTML structure"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'test_user',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.0,
-        'target_price': 110.0
-    }
+    assert _HTML_STRUCTURE.search(buy_email)
 
-    result = generate_alert_email(alert)
 
-    assert '<!DOCTYPE html>' in result
-    assert '<html>' in result
-    assert '</html>' in result
-    assert '<body' in result
-    assert '</body>' in result
+def test_template_renders_escaped_dollar_before_price():
+    """Test the template's `$$` renders as one literal `$` before each price"""
+    result = generate_alert_email(_alert(current_price=1.5, target_price=2.25))
+
+    assert '>$1.50</p>' in result
+    assert '>$2.25</p>' in result
+    assert '$$' not in result
 
 
 def test_generate_alert_email_decimal_formatting():
     """Test that prices are formatted to 2 decimal places"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'test_user',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.123456,
-        'target_price': 110.987654
-    }
-
-    result = generate_alert_email(alert)
+    result = generate_alert_email(
+        _alert(current_price=100.123456, target_price=110.987654))
 
     assert '$100.12' in result
     assert '$110.99' in result
@@ -162,32 +169,24 @@ def test_generate_alert_email_decimal_formatting():
 
 def test_generate_alert_email_single_word_username():
     """Test handling of single word username"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'john',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.0,
-        'target_price': 110.0
-    }
-
-    result = generate_alert_email(alert)
+    result = generate_alert_email(_alert(user_name='john'))
 
     assert 'John' in result
 
 
-def test_generate_alert_email_includes_view_dashboard_button():
+@covered_by_golden
+def test_generate_alert_email_includes_view_dashboard_button(buy_email):
     """Test that email includes View Dashboard button"""
-    alert = {
-        'alert_type': 'buy',
-        'user_name': 'test_user',
-        'commodity_name': 'Test',
-        'symbol': 'TST',
-        'current_price': 100.0,
-        'target_price': 110.0
-    }
+    _assert_all_in(buy_email, [
+        'View Dashboard',
+        '#03c1ff',  # Blue button color
+    ])
+
 
-    result = generate_alert_email(alert)
+def test_generate_alert_email_inserts_field_text_verbatim():
+    """Test template syntax in alert fields is not substituted again"""
+    result = generate_alert_email(_alert(
+        alert_type='sell', commodity_name='Oil ${symbol} {x}', target_price=90.0))
 
-    assert 'View Dashboard' in result
-    assert '#03c1ff' in result  # Blue button color
+    assert 'Oil ${symbol} {x}' in result
+    assert '$100.00' in result